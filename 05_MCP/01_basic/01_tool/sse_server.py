@@ -2,9 +2,12 @@
 # -*- coding:utf-8 -*-
 # sse_serve.py
 # @time:2025/9/14/21:39
-from mcp.server.fastmcp import FastMCP
+import os, sys
 
-app=FastMCP("start mcp", instructions="你是一个计算器，可以进行加减乘除运算")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from traced_fastmcp import TracedFastMCP
+
+app=TracedFastMCP("start mcp", instructions="你是一个计算器，可以进行加减乘除运算")
 
 @app.tool()
 def plus_tool(a: float,b: float) -> float:
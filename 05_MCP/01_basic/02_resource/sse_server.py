@@ -1,7 +1,12 @@
-from mcp.server.fastmcp import FastMCP
-import aiofiles, asyncio
+import aiofiles, asyncio, os, sys
 
-app = FastMCP("resource mcp", instructions="你是一个文件助手，可以帮助用户读取和写入文件内容")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from file_cache import FileCache
+from traced_fastmcp import TracedFastMCP
+
+app = TracedFastMCP("resource mcp", instructions="你是一个文件助手，可以帮助用户读取和写入文件内容")
+# 文件没有修改（mtime、size不变）时，直接返回内存中的内容，不读磁盘
+file_cache = FileCache(max_bytes=32 * 1024 * 1024)
 
 @app.resource(
     uri="file://zhiliao.txt",
@@ -10,9 +15,26 @@ app = FastMCP("resource mcp", instructions="你是一个文件助手，可以帮
     mime_type="text/plain"
 )
 async def zhiliao_resouce():
-    async with aiofiles.open("zhiliao.txt", mode='r', encoding='utf-8') as f:
-        content = await f.read()
-    return content
+    return await file_cache.read_text("zhiliao.txt")
+
+
+# 大文件分块读取：每次只读取[offset, offset + length)这一段字节，
+# 客户端循环读取，直到返回空的分块，两边都只需要持有一个分块的内存。
+# 每次最多返回MAX_CHUNK_SIZE个字节，可能比请求的length少
+MAX_CHUNK_SIZE = 1024 * 1024
+
+@app.resource(
+    uri="file://zhiliao.txt/chunk/{offset}/{length}",
+    name="zhiliao_file_chunk",
+    description="分块读取知鸟课堂的相关信息。\n:param offset: 起始的字节位置\n:param length: 读取的字节数，最多1MB",
+    mime_type="application/octet-stream"
+)
+async def zhiliao_resouce_chunk(offset: int, length: int) -> bytes:
+    if offset < 0 or length <= 0:
+        raise ValueError(f"offset不能小于0，length必须大于0：offset={offset}，length={length}")
+    async with aiofiles.open("zhiliao.txt", mode='rb') as f:
+        await f.seek(offset)
+        return await f.read(min(length, MAX_CHUNK_SIZE))
 
 # async def main():
 #     result = await zhiliao_resouce()
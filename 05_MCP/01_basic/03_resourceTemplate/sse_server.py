@@ -1,19 +1,162 @@
-from mcp.server.fastmcp import FastMCP
-import aiofiles, json, asyncio
+from bisect import bisect_left, bisect_right
+import aiofiles, json, asyncio, os, re, sys, pydantic_core
 
-app = FastMCP("resource template mcp")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from file_cache import FileCache, deep_sizeof
+from traced_fastmcp import TracedFastMCP
+
+app = TracedFastMCP("resource template mcp")
+# 成绩文件解析、序列化之后的结果，文件没有修改（mtime、size不变）时直接返回，不读磁盘也不解析JSON
+file_cache = FileCache(max_bytes=32 * 1024 * 1024)
+
+
+def serialize_grade(raw: bytes) -> str:
+    # 和FastMCP序列化返回值的方式一致，只在文件变化时执行一次
+    return pydantic_core.to_json(json.loads(raw), fallback=str, indent=2).decode()
 
 
 @app.resource(
     uri="file://data/{grade}.json",
     name="grade_score",
-    description="这边提供了一个成绩查询的MCP resource，可以根据年级grade，查询详情年级成绩信息。\n:param grade: 年级，根据用户提供的信息，转换成如下信息中的一个：grade_1、grade_2、grade_3",
+    description="这边提供了一个成绩查询的MCP resource，可以根据年级grade，查询详情年级成绩信息。只需要部分学生或统计结果时，使用grade_query、grade_top、grade_class_stats这几个Tool。\n:param grade: 年级，根据用户提供的信息，转换成如下信息中的一个：grade_1、grade_2、grade_3",
     mime_type="application/json"
 )
 async def score_detail(grade: str):
-    async with aiofiles.open(f"data/{grade}.json", mode='r', encoding='utf-8') as f:
-        content = json.loads(await f.read())
-    return content
+    return await file_cache.get(f"data/{grade}.json", serialize_grade)
+
+
+# 大文件分块读取：每次只读取[offset, offset + length)这一段字节，
+# 客户端循环读取，直到返回空的分块，两边都只需要持有一个分块的内存。
+# 每次最多返回MAX_CHUNK_SIZE个字节，可能比请求的length少
+MAX_CHUNK_SIZE = 1024 * 1024
+
+@app.resource(
+    uri="file://data/{grade}.json/chunk/{offset}/{length}",
+    name="grade_score_chunk",
+    description="分块读取年级成绩的原始JSON文件，适合很大的成绩文件。\n:param grade: 年级：grade_1、grade_2、grade_3\n:param offset: 起始的字节位置\n:param length: 读取的字节数，最多1MB",
+    mime_type="application/octet-stream"
+)
+async def score_detail_chunk(grade: str, offset: int, length: int) -> bytes:
+    if offset < 0 or length <= 0:
+        raise ValueError(f"offset不能小于0，length必须大于0：offset={offset}，length={length}")
+    async with aiofiles.open(f"data/{grade}.json", mode='rb') as f:
+        await f.seek(offset)
+        return await f.read(min(length, MAX_CHUNK_SIZE))
+
+
+class GradeIndex:
+    """
+    一个年级成绩的内存索引，只在成绩文件变化时构建一次：
+    姓名、班级、性别是哈希表（值 -> 记录下标），分数是按分数升序排列的数组，
+    每个班级的人数、平均分、最高分、最低分提前算好
+    """
+    def __init__(self, records: list[dict]):
+        self.records = records
+        self.by_name: dict[str, list[int]] = {}
+        self.by_class: dict[str, list[int]] = {}
+        self.by_gender: dict[str, list[int]] = {}
+        for i, record in enumerate(records):
+            self.by_name.setdefault(record["姓名"], []).append(i)
+            self.by_class.setdefault(record["班级"], []).append(i)
+            self.by_gender.setdefault(record["性别"], []).append(i)
+        # 分数升序排列的记录下标，和对应的分数，用二分查找做范围查询
+        self.by_score = sorted(range(len(records)), key=lambda i: records[i]["分数"])
+        self.scores = [records[i]["分数"] for i in self.by_score]
+        self.class_stats = {}
+        for class_name, indexes in self.by_class.items():
+            scores = [records[i]["分数"] for i in indexes]
+            self.class_stats[class_name] = {
+                "人数": len(scores),
+                "平均分": round(sum(scores) / len(scores), 2),
+                "最高分": max(scores),
+                "最低分": min(scores),
+            }
+
+    def query(self, name: str | None = None, class_name: str | None = None, gender: str | None = None,
+              min_score: float | None = None, max_score: float | None = None) -> list[int]:
+        """返回满足所有条件的记录下标，按分数从高到低排列"""
+        candidates = []
+        for index, value in ((self.by_name, name), (self.by_class, class_name), (self.by_gender, gender)):
+            if value is not None:
+                candidates.append(index.get(value, []))
+        if min_score is not None or max_score is not None:
+            start = bisect_left(self.scores, min_score) if min_score is not None else 0
+            end = bisect_right(self.scores, max_score) if max_score is not None else len(self.scores)
+            candidates.append(self.by_score[start:end])
+        if not candidates:
+            return self.by_score[::-1]
+        # 从最小的候选集合出发，用其他集合过滤
+        candidates.sort(key=len)
+        result = candidates[0]
+        for other in candidates[1:]:
+            other = set(other)
+            result = [i for i in result if i in other]
+        return sorted(result, key=lambda i: self.records[i]["分数"], reverse=True)
+
+
+def build_grade_index(raw: bytes) -> GradeIndex:
+    return GradeIndex(json.loads(raw))
+
+
+# 年级只能是grade_1这样的名字，不能通过..读取data目录之外的文件
+GRADE_PATTERN = re.compile(r"grade_\d+")
+# 一次最多返回的记录数
+MAX_RECORDS = 50
+
+
+async def grade_index(grade: str) -> GradeIndex:
+    if not GRADE_PATTERN.fullmatch(grade):
+        raise ValueError(f"年级不正确：{grade}，应该是grade_1、grade_2、grade_3这样的名字")
+    # 索引比成绩文件大很多，按索引实际占用的内存计算缓存大小
+    return await file_cache.get(f"data/{grade}.json", build_grade_index, size=deep_sizeof)
+
+
+def clamp_count(count: int) -> int:
+    return min(max(count, 1), MAX_RECORDS)
+
+
+# 下面几个Tool只返回符合条件的几条记录或统计结果，不需要把整个成绩文件交给大模型
+@app.tool(
+    name="grade_query",
+    description="按条件查询某个年级的学生成绩，结果按分数从高到低排列，所有条件都是可选的，多个条件同时满足。\n"
+                ":param grade: 年级：grade_1、grade_2、grade_3\n"
+                ":param name: 学生姓名\n"
+                ":param class_name: 班级，比如高一(1)班\n"
+                ":param gender: 性别：男、女\n"
+                ":param min_score: 最低分数（包含）\n"
+                ":param max_score: 最高分数（包含）\n"
+                ":param limit: 最多返回的记录数，1-50"
+)
+async def grade_query(grade: str, name: str | None = None, class_name: str | None = None, gender: str | None = None,
+                      min_score: float | None = None, max_score: float | None = None, limit: int = 20) -> dict:
+    index = await grade_index(grade)
+    result = index.query(name, class_name, gender, min_score, max_score)
+    return {"total": len(result), "records": [index.records[i] for i in result[:clamp_count(limit)]]}
+
+
+@app.tool(
+    name="grade_top",
+    description="查询某个年级（或者其中一个班级）分数最高的k个学生。\n"
+                ":param grade: 年级：grade_1、grade_2、grade_3\n"
+                ":param k: 返回的学生数，1-50\n"
+                ":param class_name: 班级，比如高一(1)班，不填表示整个年级"
+)
+async def grade_top(grade: str, k: int = 3, class_name: str | None = None) -> dict:
+    index = await grade_index(grade)
+    return {"records": [index.records[i] for i in index.query(class_name=class_name)[:clamp_count(k)]]}
+
+
+@app.tool(
+    name="grade_class_stats",
+    description="查询某个年级每个班级的人数、平均分、最高分和最低分。\n"
+                ":param grade: 年级：grade_1、grade_2、grade_3\n"
+                ":param class_name: 班级，比如高一(1)班，不填表示所有班级"
+)
+async def grade_class_stats(grade: str, class_name: str | None = None) -> dict:
+    index = await grade_index(grade)
+    if class_name is not None:
+        return {class_name: index.class_stats[class_name]} if class_name in index.class_stats else {}
+    return index.class_stats
 
 
 if __name__ == '__main__':
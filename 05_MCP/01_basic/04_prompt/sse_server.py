@@ -1,6 +1,9 @@
-from mcp.server.fastmcp import FastMCP
+import os, sys
 
-app = FastMCP("prompt mcp")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from traced_fastmcp import TracedFastMCP
+
+app = TracedFastMCP("prompt mcp")
 
 @app.prompt()
 def policy_prompt(policy: str):
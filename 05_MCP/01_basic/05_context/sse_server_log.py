@@ -2,9 +2,13 @@
 # -*- coding:utf-8 -*-
 # sse_server.py
 # @time:2025/9/15/23:04
-from mcp.server.fastmcp import FastMCP, Context
+from mcp.server.fastmcp import Context
+import os, sys
 
-app = FastMCP("sse_server_log")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from traced_fastmcp import TracedFastMCP
+
+app = TracedFastMCP("sse_server_log")
 
 @app.tool()
 async def log_tool(files:list[str], cxt:Context):
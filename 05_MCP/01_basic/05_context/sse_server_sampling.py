@@ -2,10 +2,14 @@
 # -*- coding:utf-8 -*-
 # sse_server.py
 # @time:2025/9/15/23:04
-from mcp.server.fastmcp import FastMCP, Context
+from mcp.server.fastmcp import Context
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from traced_fastmcp import TracedFastMCP
 from mcp.types import SamplingMessage, TextContent
 
-app = FastMCP("sse_server_log")
+app = TracedFastMCP("sse_server_log")
 
 @app.tool()
 async def sampling_tool(ctx: Context):
@@ -0,0 +1,121 @@
+# 服务端的文件缓存：基于文件的FastMCP Resource可以直接返回缓存好的内容（解析、序列化之后的结果），
+# 热点读取不需要读磁盘，也不需要重复解析和序列化JSON
+from collections import OrderedDict
+from functools import partial
+from typing import Any, Callable
+import aiofiles
+import os
+import sys
+import time
+
+
+def _decode(raw: bytes, encoding: str) -> str:
+    return raw.decode(encoding)
+
+
+class FileCache:
+    """
+    文件内容的内存缓存：每次读取先stat文件，mtime或size变了就重新读取；
+    所有缓存内容的总大小不超过max_bytes，超过时淘汰最久没有使用的
+    """
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, revalidate_after: float = 0):
+        """
+        :param max_bytes: 缓存内容的总大小上限（字节），比上限还大的文件不缓存
+        :param revalidate_after: 距离上次stat不到这么多秒时，直接使用缓存，不再stat，0表示每次都stat
+        """
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        # (绝对路径, loader) -> [mtime_ns, size, 上次stat的时间, 内容, 占用的字节数]
+        self._entries: OrderedDict[tuple[str, Callable], list] = OrderedDict()
+        self._decoders: dict[str, Callable[[bytes], str]] = {}
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def get(
+        self, path: str, loader: Callable[[bytes], Any] | None = None, size: Callable[[Any], int] | None = None
+    ) -> Any:
+        """
+        读取文件，返回loader(文件内容)，loader为None时返回bytes。
+        loader的结果和loader本身一起作为缓存的key，所以loader要用模块级的函数，不能每次传一个新的lambda
+        :param size: 计算loader的结果占用多少字节，用来计算max_bytes。None时字符串、bytes按实际占用的内存计算，
+            其他解析后的对象只按文件的大小计算，解析后的对象（比如建了索引）比文件大很多时要传入，比如deep_sizeof
+        """
+        key = (os.path.abspath(path), loader)
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None and now - entry[2] < self.revalidate_after:
+            return self._hit(key, entry)
+        stat = os.stat(key[0])
+        if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            entry[2] = now
+            return self._hit(key, entry)
+
+        self.misses += 1
+        async with aiofiles.open(key[0], mode='rb') as f:
+            raw = await f.read()
+        value = loader(raw) if loader is not None else raw
+        charged = size(value) if size is not None else _size_of(value, raw)
+        self._store(key, [stat.st_mtime_ns, stat.st_size, now, value, charged])
+        return value
+
+    async def read_text(self, path: str, encoding: str = "utf-8") -> str:
+        decoder = self._decoders.get(encoding)
+        if decoder is None:
+            decoder = self._decoders[encoding] = partial(_decode, encoding=encoding)
+        return await self.get(path, decoder)
+
+    def _hit(self, key: tuple[str, Callable], entry: list) -> Any:
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[3]
+
+    def _store(self, key: tuple[str, Callable], entry: list):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.current_bytes -= old[4]
+        if entry[4] > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self.current_bytes += entry[4]
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.current_bytes -= evicted[4]
+
+    def invalidate(self, path: str | None = None):
+        """让某个文件（None表示所有文件）的缓存失效"""
+        if path is None:
+            self._entries.clear()
+            self.current_bytes = 0
+            return
+        path = os.path.abspath(path)
+        for key in [key for key in self._entries if key[0] == path]:
+            self.current_bytes -= self._entries.pop(key)[4]
+
+
+def _size_of(value: Any, raw: bytes) -> int:
+    # 字符串、bytes按实际占用的内存计算，其他解析后的对象只按文件大小计算
+    if isinstance(value, (str, bytes)):
+        return sys.getsizeof(value)
+    return len(raw)
+
+
+def deep_sizeof(value: Any) -> int:
+    """对象占用的内存，递归计算容器中的元素和对象的属性，同一个对象只计算一次"""
+    seen = set()
+    total = 0
+    stack = [value]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+            stack.append(obj.__dict__)
+    return total
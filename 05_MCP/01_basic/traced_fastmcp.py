@@ -0,0 +1,12 @@
+# 01_basic中的示例Server共用的FastMCP：给Tool、Resource、Prompt加上链路追踪的span，tracing在02_application中。
+# 默认的Tracer什么都不做；设置了环境变量MCP_TRACE_FILE（绝对路径）时，span以JSON行的格式追加到这个文件中
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "02_application"))
+from tracing import JsonLinesTracer, TracedFastMCP, set_tracer
+
+if os.environ.get("MCP_TRACE_FILE"):
+    set_tracer(JsonLinesTracer(os.environ["MCP_TRACE_FILE"]))
+
+__all__ = ["TracedFastMCP"]
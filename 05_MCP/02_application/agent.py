@@ -0,0 +1,157 @@
+# 基于MCPServerManager的Agent循环：大模型选择函数，Agent并发调用MCP Server，再把结果交给大模型
+from openai import AsyncOpenAI
+from typing import Any, Callable
+from server import MCPServerManager
+from concurrency import Deadline
+from llm import StreamingLLM
+from retrieval import FunctionIndex
+from tracing import get_tracer
+import asyncio
+import contextvars
+import json
+import os
+import dotenv
+
+
+class MCPAgent:
+    def __init__(
+        self,
+        manager: MCPServerManager,
+        llm: StreamingLLM,
+        max_tool_concurrency: int = 8,
+        max_rounds: int = 5,
+        on_token: Callable[[str], None] | None = None,
+        top_k: int | None = None,
+        turn_timeout: float | None = None,
+    ):
+        """
+        :param manager: 已经初始化好的MCPServerManager
+        :param llm: 异步流式的大模型客户端
+        :param max_tool_concurrency: 同一条assistant消息中的tool_calls，最多同时调用多少个
+        :param max_rounds: 最多进行多少轮函数调用，超过后要求大模型直接回答
+        :param on_token: 大模型每输出一段文本就调用一次，比如print(token, end="")
+        :param top_k: 只把和用户问题最相关的top_k个函数发给大模型（本地BM25检索），
+            相关的函数不够top_k个时按目录的顺序补齐，None表示发送全部函数
+        :param turn_timeout: 一次run的总时间（秒），大模型补全和函数调用共用这个截止时间，
+            超过后抛出TimeoutError，None表示不限制
+        """
+        self.manager = manager
+        self.llm = llm
+        self.max_tool_concurrency = max_tool_concurrency
+        self.max_rounds = max_rounds
+        self.on_token = on_token
+        self.top_k = top_k
+        self.turn_timeout = turn_timeout
+        self.function_index = FunctionIndex()
+
+    async def run(self, query: str) -> str:
+        with get_tracer().start_span("MCPAgent.run", {"agent.max_rounds": self.max_rounds}):
+            return await self._run(query)
+
+    async def _run(self, query: str) -> str:
+        deadline = Deadline(self.turn_timeout) if self.turn_timeout is not None else None
+        tools = self.select_tools(query)
+        messages: list[dict[str, Any]] = [{
+            "role": "user",
+            "content": query
+        }]
+        semaphore = asyncio.Semaphore(self.max_tool_concurrency)
+        for _ in range(self.max_rounds):
+            # 每个tool_call的参数一完整就开始调用，不等整个补全结束
+            tasks: dict[str, asyncio.Task] = {}
+            # 在补全的过程中开始的调用，span挂在run下面，而不是大模型补全的span下面
+            context = contextvars.copy_context()
+
+            def start_tool_call(tool_call: dict[str, Any]):
+                tasks[tool_call["id"]] = asyncio.create_task(
+                    self._call_tool(tool_call, semaphore, deadline), context=context.copy()
+                )
+
+            try:
+                response = await self._complete(
+                    deadline, messages, tools=tools, on_token=self.on_token, on_tool_call=start_tool_call
+                )
+            except BaseException:
+                for task in tasks.values():
+                    task.cancel()
+                raise
+            if not response.tool_calls:
+                return response.content
+            messages.append(response.to_message())
+            for tool_call in response.tool_calls:
+                if tool_call["id"] not in tasks:
+                    start_tool_call(tool_call)
+            # 按tool_calls原本的顺序添加role=tool消息
+            messages.extend(await asyncio.gather(*(
+                tasks[tool_call["id"]] for tool_call in response.tool_calls
+            )))
+
+        # 函数调用的轮数用完了，让大模型根据已有的结果回答
+        response = await self._complete(deadline, messages, on_token=self.on_token)
+        return response.content
+
+    async def _complete(self, deadline: Deadline | None, *args, **kwargs):
+        if deadline is None:
+            return await self.llm.complete(*args, **kwargs)
+        async with asyncio.timeout(deadline.remaining()):
+            return await self.llm.complete(*args, **kwargs)
+
+    def select_tools(self, query: str) -> list[dict[str, Any]]:
+        if self.top_k is None:
+            return self.manager.tool_schemas.tools()
+        # 函数目录变化时增量更新索引
+        self.function_index.sync(self.manager.all_functions)
+        names = self.function_index.top_names(query, self.top_k)
+        tools = self.manager.tool_schemas.subset(names)
+        if len(tools) < self.top_k:
+            # 问题和函数的描述没有几个共同的词时，检索到的函数不够k个，按目录的顺序补齐，保证大模型有函数可以调用
+            for tool in self.manager.tool_schemas.tools():
+                if len(tools) >= self.top_k:
+                    break
+                if tool["function"]["name"] not in names:
+                    tools.append(tool)
+        return tools
+
+    async def call_tools(self, tool_calls: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """
+        并发调用一条assistant消息中的所有tool_calls，返回的role=tool消息和tool_calls的顺序一致。
+        单个调用出错时，把错误信息作为这个调用的结果返回给大模型，不影响其他调用
+        """
+        semaphore = asyncio.Semaphore(self.max_tool_concurrency)
+        # gather返回结果的顺序和传入的顺序一致
+        return await asyncio.gather(*(self._call_tool(tool_call, semaphore) for tool_call in tool_calls))
+
+    async def _call_tool(
+        self, tool_call: dict[str, Any], semaphore: asyncio.Semaphore, deadline: Deadline | None = None
+    ) -> dict[str, Any]:
+        function_name = tool_call["function"]["name"]
+        async with semaphore:
+            try:
+                function_arguments = json.loads(tool_call["function"]["arguments"] or "{}")
+                content = await self.manager.call_function(function_name, function_arguments, deadline=deadline)
+            except Exception as e:
+                content = f"调用{function_name}失败：{e!r}"
+        return {
+            "role": "tool",
+            "content": str(content),
+            "tool_call_id": tool_call["id"]
+        }
+
+
+async def main():
+    dotenv.load_dotenv()
+    mcp_dicts = {
+        "calculator": {"url": "http://127.0.0.1:8000/sse"},
+    }
+    llm = StreamingLLM(AsyncOpenAI(
+        api_key=os.getenv("DEEPSEEK_API_KEY"),
+        base_url="https://api.deepseek.com"
+    ))
+    async with MCPServerManager(mcp_dicts, concurrent=True) as manager:
+        agent = MCPAgent(manager, llm, on_token=lambda token: print(token, end="", flush=True))
+        await agent.run("请你计算一下 12 + 34 = ?，再计算一下 56 - 78 = ?")
+        print()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,344 @@
+# 离线的正确性检查，不需要大模型的API Key，也不需要手动启动Server：
+# 用01_basic中的示例Server（以及临时生成的Server）检查各个功能的行为，
+# 任何一项不符合预期时退出码不为0
+# 运行：python benchmarks/checks.py
+#      python benchmarks/checks.py tracing
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+APPLICATION_DIR = os.path.dirname(BENCHMARK_DIR)
+EXAMPLES_DIR = os.path.join(os.path.dirname(APPLICATION_DIR), "01_basic")
+sys.path.insert(0, APPLICATION_DIR)
+
+from mcp.shared.exceptions import McpError
+from agent import MCPAgent
+from cache import LRUCache
+from concurrency import AdmissionController
+from server import MCPServerManager
+from tracing import InMemoryTracer, load_spans, set_tracer
+
+# 幂等的慢Tool，用来检查对冲、熔断
+SLOW_SERVER = '''
+import asyncio
+from mcp.server.fastmcp import FastMCP
+from mcp.types import ToolAnnotations
+
+app = FastMCP("slow")
+
+
+@app.tool(annotations=ToolAnnotations(readOnlyHint=True))
+async def sleep_tool(seconds: float) -> str:
+    """sleep"""
+    await asyncio.sleep(seconds)
+    return "ok"
+
+
+app.run(transport="stdio")
+'''
+
+# Resource返回进程号，Tool让进程退出，用来检查重新连接后的缓存
+RESTART_SERVER = '''
+import os
+from mcp.server.fastmcp import FastMCP
+
+app = FastMCP("restart")
+
+
+@app.resource("pid://self")
+def pid_resource() -> str:
+    """pid"""
+    return str(os.getpid())
+
+
+@app.tool()
+def exit_tool() -> str:
+    """exit"""
+    os._exit(1)
+
+
+app.run(transport="stdio")
+'''
+
+
+# 没有annotations的计数Tool和只读的慢Tool，用来检查合并相同的并发调用
+COUNTER_SERVER = '''
+import asyncio
+from mcp.server.fastmcp import FastMCP
+from mcp.types import ToolAnnotations
+
+app = FastMCP("counter")
+count = 0
+
+
+@app.tool()
+async def increment_tool() -> str:
+    """increment"""
+    global count
+    count += 1
+    value = count
+    await asyncio.sleep(0.1)
+    return str(value)
+
+
+@app.tool(annotations=ToolAnnotations(readOnlyHint=True))
+async def count_tool() -> str:
+    """count"""
+    await asyncio.sleep(0.1)
+    return str(count)
+
+
+app.run(transport="stdio")
+'''
+
+
+def example(path: str, env: dict[str, str] | None = None) -> dict:
+    """用stdio启动示例Server的mcp_dict"""
+    mcp_dict = {
+        "command": sys.executable,
+        "args": [os.path.join(BENCHMARK_DIR, "example_server.py"), path, "stdio"],
+    }
+    if env:
+        mcp_dict["env"] = {**os.environ, **env}
+    return mcp_dict
+
+
+def grade_example(workdir: str, big_size: int) -> str:
+    """
+    复制一份03_resourceTemplate的示例Server，data目录中再放一个big_size字节左右的grade_big.json，
+    返回复制后的sse_server.py路径
+    """
+    # 和原来的目录结构一样：traced_fastmcp.py从01_basic旁边的02_application中导入tracing
+    examples_dir = os.path.join(workdir, "01_basic")
+    os.mkdir(examples_dir)
+    for name in ("file_cache.py", "traced_fastmcp.py"):
+        shutil.copy(os.path.join(EXAMPLES_DIR, name), examples_dir)
+    os.symlink(APPLICATION_DIR, os.path.join(workdir, "02_application"))
+    example_dir = os.path.join(examples_dir, "03_resourceTemplate")
+    shutil.copytree(os.path.join(EXAMPLES_DIR, "03_resourceTemplate"), example_dir,
+                    ignore=shutil.ignore_patterns("__pycache__"))
+    record = {"姓名": "张伟", "分数": 88, "性别": "男", "班级": "高一(1)班"}
+    records = [record] * (big_size // len(json.dumps(record, ensure_ascii=False).encode("utf-8")) + 1)
+    with open(os.path.join(example_dir, "data", "grade_big.json"), mode='w', encoding='utf-8') as f:
+        json.dump(records, f, ensure_ascii=False)
+    return os.path.join(example_dir, "sse_server.py")
+
+
+def temp_server(workdir: str, source: str, **config) -> dict:
+    """把source写到临时文件中，返回用stdio启动它的mcp_dict"""
+    path = os.path.join(workdir, "temp_server.py")
+    with open(path, mode='w', encoding='utf-8') as f:
+        f.write(source)
+    return {"command": sys.executable, "args": [path], **config}
+
+
+async def check_tracing(workdir: str):
+    """服务端的FastMCP.call_tool span挂在客户端的MCPServer.call_function span下面"""
+    trace_file = os.path.join(workdir, "server_spans.jsonl")
+    tracer = InMemoryTracer()
+    set_tracer(tracer)
+    try:
+        mcp_dicts = {"tool": example(os.path.join(EXAMPLES_DIR, "01_tool/sse_server.py"), {"MCP_TRACE_FILE": trace_file})}
+        async with MCPServerManager(mcp_dicts) as manager:
+            assert await manager.call_function("plus_tool", {"a": 12, "b": 34}) == "46.0"
+    finally:
+        set_tracer(None)
+    [manager_span] = tracer.find("MCPServerManager.call_function")
+    [client_span] = tracer.find("MCPServer.call_function")
+    assert client_span.parent_id == manager_span.span_id, "MCPServer.call_function不在MCPServerManager.call_function下面"
+    server_spans = [span for span in load_spans(trace_file) if span.name == "FastMCP.call_tool"]
+    assert len(server_spans) == 1, f"服务端的FastMCP.call_tool span有{len(server_spans)}个"
+    assert server_spans[0].trace_id == client_span.trace_id, "服务端的span不在同一条链路上"
+    assert server_spans[0].parent_id == client_span.span_id, "FastMCP.call_tool不在MCPServer.call_function下面"
+
+
+async def check_circuit_breaker(workdir: str):
+    """参数错误不算Server的故障，不会打开熔断器"""
+    mcp_dict = example(os.path.join(EXAMPLES_DIR, "03_resourceTemplate/sse_server.py"))
+    mcp_dict["circuit_breaker"] = {"min_calls": 4}
+    async with MCPServerManager({"tmpl": mcp_dict}) as manager:
+        for _ in range(8):
+            try:
+                await manager.call_function("grade_score", {"grade": "grade_1", "name": "张伟"})
+            except ValueError:
+                pass
+        assert manager.breaker_stats()["tmpl"]["state"] == "closed", manager.breaker_stats()
+        assert "张伟" in await manager.call_function("grade_score", {"grade": "grade_1"})
+
+
+async def check_breaker_latency(workdir: str):
+    """在准入控制中排队的时间不计入熔断器统计的耗时"""
+    mcp_dict = temp_server(
+        workdir, SLOW_SERVER,
+        limits={"max_concurrency": 1},
+        circuit_breaker={"min_calls": 4, "latency_threshold": 0.15},
+    )
+    async with MCPServerManager({"slow": mcp_dict}, single_flight=False) as manager:
+        results = await manager.call_many([("sleep_tool", {"seconds": 0.05})] * 12)
+        assert all(result.ok for result in results), [result.error for result in results]
+        stats = manager.breaker_stats()["slow"]
+        assert stats["state"] == "closed", stats
+
+
+async def check_hedging(workdir: str):
+    """所有连接都在忙时不发送对冲请求"""
+    mcp_dict = temp_server(workdir, SLOW_SERVER, pool={"min_size": 2, "max_size": 2, "hedge": True, "hedge_min_samples": 5})
+    async with MCPServerManager({"slow": mcp_dict}, single_flight=False) as manager:
+        pool = manager.servers["slow"]
+        for _ in range(10):
+            await manager.call_function("sleep_tool", {"seconds": 0.01})
+        results = await manager.call_many([("sleep_tool", {"seconds": 0.3})] * 6)
+        assert all(result.ok for result in results), [result.error for result in results]
+        assert pool.hedged == 0, f"连接都在忙时发送了{pool.hedged}个对冲请求"
+        assert pool._pick_member(exclude=object()) in pool.members
+
+
+async def check_resource_cache(workdir: str):
+    """重新连接后不再使用旧会话缓存的Resource读取结果"""
+    async with MCPServerManager({"restart": temp_server(workdir, RESTART_SERVER)}, resource_cache=LRUCache()) as manager:
+        pid = await manager.call_function("pid_resource")
+        assert await manager.call_function("pid_resource") == pid
+        try:
+            await manager.call_function("exit_tool")
+        except Exception:
+            pass
+        new_pid = await manager.call_function("pid_resource")
+        assert new_pid != pid, "重新连接后仍然返回了旧进程的缓存结果"
+
+
+async def check_single_flight(workdir: str):
+    """只合并幂等的函数，没有annotations的Tool每次调用都发给服务端"""
+    async with MCPServerManager({"counter": temp_server(workdir, COUNTER_SERVER)}) as manager:
+        results = await manager.call_many([("increment_tool", {})] * 4)
+        assert sorted(result.result for result in results) == ["1", "2", "3", "4"], [result.result for result in results]
+        server = manager.servers["counter"]
+        calls = []
+        original = server.call_function
+
+        async def counting_call(*args, **kwargs):
+            calls.append(args)
+            return await original(*args, **kwargs)
+
+        server.call_function = counting_call
+        results = await manager.call_many([("count_tool", {})] * 4)
+        assert [result.result for result in results] == ["4"] * 4, [result.result for result in results]
+        assert len(calls) == 1, f"只读的Tool没有合并，发送了{len(calls)}个请求"
+
+
+async def check_chunked_reads(workdir: str):
+    """
+    chunk_size大于服务端的分块上限时也能读完整个文件，分块不进入Resource缓存，
+    非法的chunk_size、length被拒绝，分块模板不发给大模型
+    """
+    path = grade_example(workdir, 3 * 1024 * 1024)
+    size = os.path.getsize(os.path.join(os.path.dirname(path), "data", "grade_big.json"))
+    resource_cache = LRUCache()
+    async with MCPServerManager({"tmpl": example(path)}, resource_cache=resource_cache) as manager:
+        total = 0
+        async for chunk in manager.read_chunks("grade_score_chunk", {"grade": "grade_big"}, chunk_size=4 * 1024 * 1024):
+            total += chunk.nbytes
+        assert total == size, f"读取了{total}字节，文件有{size}字节"
+        assert len(resource_cache) == 0, f"分块读取的结果进入了Resource缓存：{resource_cache.current_bytes}字节"
+        for chunk_size in (0, -1):
+            try:
+                manager.read_chunks("grade_score_chunk", {"grade": "grade_1"}, chunk_size=chunk_size)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(f"chunk_size={chunk_size}没有被拒绝")
+        try:
+            await manager.call_function("grade_score_chunk", {"grade": "grade_big", "offset": 0, "length": -1})
+        except McpError:
+            pass
+        else:
+            raise AssertionError("length=-1没有被拒绝")
+        names = {tool["function"]["name"] for tool in manager.tool_schemas.tools()}
+        assert "grade_score_chunk" not in names, "分块读取的模板出现在了tools中"
+
+
+async def check_grade_tools(workdir: str):
+    """成绩查询的Tool不能读取data目录之外的文件，limit、k至少是1"""
+    path = grade_example(workdir, 0)
+    async with MCPServerManager({"tmpl": example(path)}) as manager:
+        result = await manager.call_function("grade_top", {"grade": "../03_resourceTemplate/data/grade_2"})
+        assert "年级不正确" in result, result
+        result = json.loads(await manager.call_function("grade_query", {"grade": "grade_1", "limit": -1}))
+        assert len(result["records"]) == 1, result
+        result = json.loads(await manager.call_function("grade_top", {"grade": "grade_1", "k": 0}))
+        assert len(result["records"]) == 1, result
+
+
+async def check_admission(workdir: str):
+    """排队时超时的调用归还令牌，后面的调用不会被限制在rate以下"""
+    admission = AdmissionController("check", rate=10, burst=1, max_queue=None)
+
+    async def call(timeout: float) -> bool:
+        try:
+            async with asyncio.timeout(timeout):
+                async with admission.slot():
+                    return True
+        except TimeoutError:
+            return False
+
+    results = await asyncio.gather(*(call(0.05) for _ in range(20)))
+    assert results.count(False) >= 15, results
+    await asyncio.sleep(0.2)
+    start = time.monotonic()
+    assert await call(5)
+    waited = time.monotonic() - start
+    assert waited < 0.1, f"令牌桶透支，等待了{waited:.3g}秒"
+
+
+async def check_select_tools(workdir: str):
+    """检索到的函数不够top_k个时按目录补齐"""
+    mcp_dicts = {
+        "tool": example(os.path.join(EXAMPLES_DIR, "01_tool/sse_server.py")),
+        "tmpl": example(os.path.join(EXAMPLES_DIR, "03_resourceTemplate/sse_server.py")),
+    }
+    async with MCPServerManager(mcp_dicts) as manager:
+        agent = MCPAgent(manager, None, top_k=3)
+        for query in ("hello", "What is 12 plus 34?"):
+            names = [tool["function"]["name"] for tool in agent.select_tools(query)]
+            assert len(names) == 3, f"{query!r}只选出了{names}"
+        names = [tool["function"]["name"] for tool in agent.select_tools("What is 12 plus 34?")]
+        assert names[0] == "plus_tool", names
+
+
+CHECKS = {
+    "tracing": check_tracing,
+    "circuit_breaker": check_circuit_breaker,
+    "breaker_latency": check_breaker_latency,
+    "hedging": check_hedging,
+    "resource_cache": check_resource_cache,
+    "single_flight": check_single_flight,
+    "chunked_reads": check_chunked_reads,
+    "grade_tools": check_grade_tools,
+    "admission": check_admission,
+    "select_tools": check_select_tools,
+}
+
+
+async def main(names: list[str]) -> int:
+    failed = 0
+    for name in names or CHECKS:
+        start = time.perf_counter()
+        with tempfile.TemporaryDirectory() as workdir:
+            try:
+                await CHECKS[name](workdir)
+            except Exception:
+                failed += 1
+                print(f"FAIL {name}")
+                traceback.print_exc()
+                continue
+        print(f"ok   {name} ({time.perf_counter() - start:.2f}s)")
+    return failed
+
+
+if __name__ == '__main__':
+    sys.exit(1 if asyncio.run(main(sys.argv[1:])) else 0)
@@ -0,0 +1,28 @@
+# 用指定的传输方式运行01_basic中的示例FastMCP Server，供mcp_benchmark.py、checks.py启动
+# 运行：python benchmarks/example_server.py ../01_basic/01_tool/sse_server.py stdio
+#      python benchmarks/example_server.py ../01_basic/01_tool/sse_server.py sse 8123
+# 示例Server使用TracedFastMCP，设置了环境变量MCP_TRACE_FILE时，服务端的span以JSON行的格式追加到这个文件中
+import logging
+import os
+import runpy
+import sys
+
+
+def main():
+    path, transport = os.path.abspath(sys.argv[1]), sys.argv[2]
+    # 每个请求一行的INFO日志（Processing request of type ...）会影响测试结果
+    logging.disable(logging.INFO)
+    if os.environ.get("MCP_TRACE_FILE"):
+        # 下面会切换工作目录
+        os.environ["MCP_TRACE_FILE"] = os.path.abspath(os.environ["MCP_TRACE_FILE"])
+    # 示例中读取的文件（zhiliao.txt、data/grade_1.json）都是相对于示例所在目录的
+    os.chdir(os.path.dirname(path))
+    # run_name不是__main__，示例中的app.run(transport="sse")不会执行
+    app = runpy.run_path(path, run_name="example")["app"]
+    if transport == "sse":
+        app.settings.port = int(sys.argv[3])
+    app.run(transport=transport)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,315 @@
+# MCP客户端和服务端的性能测试，不需要大模型的API Key，也不需要手动启动Server：
+# 分别用stdio和SSE启动01_basic中的示例Server，测试启动、获取函数目录的耗时，
+# 以及Tool、Resource、Resource Template、Prompt在不同并发数下的调用延迟和吞吐；
+# 再用脚本化的本地大模型驱动MCPAgent，测试整轮对话的耗时。结果保存成JSON，方便在不同提交之间比较
+# 运行：python benchmarks/mcp_benchmark.py --calls 200 --concurrency 1 8 32
+#      python benchmarks/mcp_benchmark.py --compare benchmarks/results/上一次的结果.json
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+APPLICATION_DIR = os.path.dirname(BENCHMARK_DIR)
+EXAMPLES_DIR = os.path.join(os.path.dirname(APPLICATION_DIR), "01_basic")
+sys.path.insert(0, APPLICATION_DIR)
+
+from agent import MCPAgent
+from llm import LLMResponse
+from metrics import MCPMetrics
+from server import MCPServerManager
+
+# 示例Server -> (示例文件, 测试的函数, 参数)
+EXAMPLES = {
+    "tool": ("01_tool/sse_server.py", "plus_tool", {"a": 12, "b": 34}),
+    "resource": ("02_resource/sse_server.py", "zhiliao_file", {}),
+    "template": ("03_resourceTemplate/sse_server.py", "grade_score", {"grade": "grade_1"}),
+    "prompt": ("04_prompt/sse_server.py", "policy_prompt", {"policy": "2025年起，新能源汽车购置税减半征收"}),
+}
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def summarize(latencies: list[float], elapsed: float, errors: int) -> dict[str, Any]:
+    """耗时统一换算成毫秒"""
+    if not latencies:
+        return {"calls": 0, "errors": errors}
+    return {
+        "calls": len(latencies),
+        "errors": errors,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "calls_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+    }
+
+
+class ScriptedLLM:
+    """
+    本地的脚本化大模型，接口和StreamingLLM一致：第一次补全按脚本返回tool_calls
+    （像流式输出那样逐个通知on_tool_call），之后的补全返回固定的文本
+    """
+    def __init__(self, tool_calls: list[tuple[str, dict[str, Any]]], delay: float = 0.0):
+        """
+        :param tool_calls: [(函数名, 参数), ...]
+        :param delay: 每次补全模拟的耗时（秒）
+        """
+        self.tool_calls = tool_calls
+        self.delay = delay
+
+    async def complete(self, messages, tools=None, on_token=None, on_tool_call=None) -> LLMResponse:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        response = LLMResponse()
+        if messages[-1]["role"] == "user":
+            response.finish_reason = "tool_calls"
+            for index, (name, arguments) in enumerate(self.tool_calls):
+                tool_call = {
+                    "id": f"call_{index}",
+                    "type": "function",
+                    "function": {"name": name, "arguments": json.dumps(arguments, ensure_ascii=False)},
+                }
+                response.tool_calls.append(tool_call)
+                if on_tool_call is not None:
+                    on_tool_call(tool_call)
+            return response
+        response.content = "done"
+        response.finish_reason = "stop"
+        if on_token is not None:
+            on_token(response.content)
+        return response
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_port(port: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"端口{port}在{timeout}秒内没有启动")
+            await asyncio.sleep(0.05)
+
+
+def example_command(example: str, transport: str, port: int | None = None) -> list[str]:
+    path = os.path.join(EXAMPLES_DIR, EXAMPLES[example][0])
+    args = [os.path.join(BENCHMARK_DIR, "example_server.py"), path, transport]
+    if port is not None:
+        args.append(str(port))
+    return args
+
+
+async def start_sse_servers() -> tuple[dict[str, dict], list[subprocess.Popen], float]:
+    """启动所有示例的SSE Server，返回mcp_dicts、子进程，以及等待端口可用的耗时"""
+    mcp_dicts = {}
+    processes = []
+    start = time.perf_counter()
+    ports = {}
+    for example in EXAMPLES:
+        port = ports[example] = free_port()
+        processes.append(subprocess.Popen(
+            [sys.executable, *example_command(example, "sse", port)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ))
+        mcp_dicts[example] = {"url": f"http://127.0.0.1:{port}/sse"}
+    try:
+        await asyncio.gather(*(wait_for_port(port) for port in ports.values()))
+    except BaseException:
+        stop_processes(processes)
+        raise
+    return mcp_dicts, processes, time.perf_counter() - start
+
+
+def stop_processes(processes: list[subprocess.Popen]):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def drive(call: Callable[[], Any], calls: int, concurrency: int, warmup: int = 10) -> dict[str, Any]:
+    """用concurrency个worker一共调用calls次"""
+    for _ in range(warmup):
+        await call()
+    latencies: list[float] = []
+    errors = 0
+    remaining = calls
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            try:
+                await call()
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+async def measure_discovery(manager: MCPServerManager, rounds: int) -> dict[str, Any]:
+    """重复获取每个Server的函数目录"""
+    result = {}
+    for name, server in manager.servers.items():
+        latencies = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            await server.fetch_functions()
+            latencies.append(time.perf_counter() - start)
+        result[name] = summarize(latencies, sum(latencies), 0)
+    return result
+
+
+async def run_transport(transport: str, args) -> dict[str, Any]:
+    processes = []
+    result: dict[str, Any] = {}
+    if transport == "stdio":
+        mcp_dicts = {
+            example: {"command": sys.executable, "args": example_command(example, "stdio")}
+            for example in EXAMPLES
+        }
+    else:
+        mcp_dicts, processes, process_start = await start_sse_servers()
+        result["process_start_s"] = process_start
+    metrics = MCPMetrics()
+    try:
+        start = time.perf_counter()
+        manager = MCPServerManager(mcp_dicts, concurrent=True, single_flight=args.single_flight, metrics=metrics)
+        async with manager:
+            result["startup_s"] = time.perf_counter() - start
+            # 每个Server连接、握手、第一次获取函数目录的耗时
+            result["startup_phases_ms"] = {
+                f"{server}.{phase}": histogram.sum * 1000
+                for (phase, server, _), histogram in metrics.latencies.items()
+                if phase != "call"
+            }
+            result["discovery"] = await measure_discovery(manager, args.discovery_rounds)
+            result["calls"] = {}
+            for example, (_, function_name, arguments) in EXAMPLES.items():
+                result["calls"][example] = {}
+                for concurrency in args.concurrency:
+                    summary = await drive(
+                        lambda: manager.call_function(function_name, arguments), args.calls, concurrency
+                    )
+                    result["calls"][example][str(concurrency)] = summary
+                    print(f"{transport:>5} {example:>8} c={concurrency:<3} | p50 {summary.get('p50_ms', 0):7.2f} ms  "
+                          f"p95 {summary.get('p95_ms', 0):7.2f} ms  p99 {summary.get('p99_ms', 0):7.2f} ms  "
+                          f"{summary.get('calls_per_sec', 0):8.1f} calls/s  errors {summary['errors']}")
+            result["agent"] = await run_agent(manager, args)
+    finally:
+        stop_processes(processes)
+    return result
+
+
+async def run_agent(manager: MCPServerManager, args) -> dict[str, Any]:
+    """脚本化的大模型每轮调用每种函数各一次，测试一整轮对话的耗时"""
+    llm = ScriptedLLM(
+        [(function_name, arguments) for _, function_name, arguments in EXAMPLES.values()],
+        delay=args.llm_delay,
+    )
+    agent = MCPAgent(manager, llm)
+    summary = await drive(lambda: agent.run("benchmark"), args.agent_turns, 1, warmup=2)
+    print(f"agent turn (llm delay {args.llm_delay * 1000:.0f} ms) | p50 {summary.get('p50_ms', 0):7.2f} ms  "
+          f"p95 {summary.get('p95_ms', 0):7.2f} ms")
+    return summary
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=APPLICATION_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict[str, Any], previous: dict[str, Any]):
+    """打印和之前的结果相比，p50延迟和吞吐的变化"""
+    print(f"\n和 {previous['meta'].get('commit')} 比较（p50延迟 / 吞吐，正数表示变慢 / 变快）：")
+    for transport, result in current["results"].items():
+        old_result = previous["results"].get(transport)
+        if old_result is None:
+            continue
+        for example, by_concurrency in result["calls"].items():
+            for concurrency, summary in by_concurrency.items():
+                old = old_result.get("calls", {}).get(example, {}).get(concurrency)
+                if not old or not old.get("calls") or not summary.get("calls"):
+                    continue
+                latency = (summary["p50_ms"] / old["p50_ms"] - 1) * 100
+                throughput = (summary["calls_per_sec"] / old["calls_per_sec"] - 1) * 100
+                print(f"{transport:>5} {example:>8} c={concurrency:<3} | p50 {latency:+6.1f}%  calls/s {throughput:+6.1f}%")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="MCP客户端和服务端的离线性能测试")
+    parser.add_argument("--transports", nargs="+", default=["stdio", "sse"], choices=["stdio", "sse"])
+    parser.add_argument("--calls", type=int, default=200, help="每种函数、每个并发数的调用次数")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--discovery-rounds", type=int, default=20, help="重复获取函数目录的次数")
+    parser.add_argument("--agent-turns", type=int, default=20, help="脚本化大模型驱动的对话轮数")
+    parser.add_argument("--llm-delay", type=float, default=0.0, help="脚本化大模型每次补全模拟的耗时（秒）")
+    parser.add_argument("--single-flight", action="store_true", help="合并相同的并发调用（默认关闭，否则吞吐会偏高）")
+    parser.add_argument("--output", help="结果保存的路径，默认是benchmarks/results/<时间>-<提交>.json")
+    parser.add_argument("--compare", help="和之前保存的结果比较")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": commit,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "calls": args.calls,
+            "concurrency": args.concurrency,
+            "single_flight": args.single_flight,
+        },
+        "results": {},
+    }
+    for transport in args.transports:
+        report["results"][transport] = await run_transport(transport, args)
+
+    output = args.output or os.path.join(
+        BENCHMARK_DIR, "results", f"{time.strftime('%Y%m%d-%H%M%S')}-{commit or 'unknown'}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到 {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+# 函数检索索引的性能测试：分别在1k和10k个函数上测试建索引和查询的耗时
+# 运行：python benchmarks/retrieval_benchmark.py
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import MCPFunction, MCPFunctionType
+from retrieval import FunctionIndex
+
+VERBS = ["read", "write", "list", "search", "create", "delete", "update", "query", "get", "compute"]
+NOUNS = ["file", "user", "order", "grade", "score", "policy", "table", "issue", "repo", "invoice",
+         "message", "calendar", "weather", "stock", "report"]
+CN_WORDS = ["查询", "成绩", "文件", "用户", "订单", "政策", "天气", "计算", "报表", "年级", "学生", "读取"]
+QUERIES = [
+    "查找3年级的成绩，并比较一下王二和张三的成绩",
+    "请你计算一下 12 + 34 = ?",
+    "read the weather report for tomorrow",
+    "帮我总结一下这个政策",
+    "list all open issues in the repo",
+    "delete the invoice for order 42",
+]
+
+
+def make_functions(count: int, seed: int = 0) -> dict[str, MCPFunction]:
+    rng = random.Random(seed)
+    functions = {}
+    for i in range(count):
+        verb, noun = rng.choice(VERBS), rng.choice(NOUNS)
+        name = f"{verb}_{noun}_{i}"
+        description = " ".join([
+            f"{verb} {noun} records",
+            "".join(rng.sample(CN_WORDS, 3)),
+            " ".join(rng.sample(NOUNS, 3)),
+        ])
+        functions[name] = MCPFunction(
+            name=name,
+            origin_name=name,
+            server_name=f"server_{i % 20}",
+            description=description,
+            type_=MCPFunctionType.TOOL,
+            input_schema={"type": "object", "properties": {noun: {"type": "string"}, "limit": {"type": "integer"}}},
+        )
+    return functions
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(count: int, rounds: int = 200, k: int = 10):
+    functions = make_functions(count)
+    index = FunctionIndex()
+    start = time.perf_counter()
+    index.sync(functions)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    for i in range(rounds):
+        query = QUERIES[i % len(QUERIES)]
+        start = time.perf_counter()
+        index.search(query, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    # 增量更新：新增一个Server的50个函数
+    extra = make_functions(50, seed=1)
+    extra = {f"new_{name}": function.model_copy(update={"name": f"new_{name}"}) for name, function in extra.items()}
+    start = time.perf_counter()
+    index.sync({**functions, **extra})
+    update_ms = (time.perf_counter() - start) * 1000
+
+    print(f"{count:>6} functions | build {build_ms:8.1f} ms | incremental +50 {update_ms:6.1f} ms | "
+          f"query p50 {statistics.median(latencies):6.3f} ms  p95 {percentile(latencies, 0.95):6.3f} ms  "
+          f"max {max(latencies):6.3f} ms")
+
+
+if __name__ == '__main__':
+    for count in (1_000, 10_000):
+        run(count)
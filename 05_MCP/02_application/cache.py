@@ -0,0 +1,174 @@
+# 客户端的缓存：带过期时间、按大小淘汰的LRU缓存，以及基于它的Resource缓存和Tool调用结果缓存
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable
+
+from mcp.types import CallToolResult, ReadResourceResult
+from models import MCPFunction
+
+
+class LRUCache:
+    """
+    LRU缓存，可以同时限制总大小（max_bytes）和条目数（max_entries），每个条目可以有自己的过期时间
+    """
+    def __init__(
+        self,
+        max_bytes: int | None = 64 * 1024 * 1024,
+        max_entries: int | None = None,
+        default_ttl: float | None = None,
+    ):
+        """
+        :param max_bytes: 所有条目的大小之和的上限，None表示不限制
+        :param max_entries: 条目数量的上限，None表示不限制
+        :param default_ttl: 条目默认的过期时间（秒），None表示不过期
+        """
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        # key -> (value, size, expires_at)
+        self._entries: OrderedDict[Hashable, tuple[Any, int, float | None]] = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        value, size, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.pop(key)
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, size: int = 0, ttl: float | None = None):
+        """
+        :param size: 条目的大小，用来计算max_bytes
+        :param ttl: 过期时间（秒），None时使用default_ttl
+        """
+        if self.max_bytes is not None and size > self.max_bytes:
+            # 单个条目就超过了上限，不缓存
+            self.pop(key)
+            return
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        self.pop(key)
+        self._entries[key] = (value, size, expires_at)
+        self.current_bytes += size
+        # 从最久没有使用的条目开始淘汰
+        while ((self.max_bytes is not None and self.current_bytes > self.max_bytes)
+               or (self.max_entries is not None and len(self._entries) > self.max_entries)):
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted_size
+
+    def pop(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry[1]
+
+    def pop_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """删除key满足predicate的所有条目，返回删除的数量"""
+        keys = [key for key in self._entries if predicate(key)]
+        for key in keys:
+            self.pop(key)
+        return len(keys)
+
+    def clear(self):
+        self._entries.clear()
+        self.current_bytes = 0
+
+
+def resource_size(result: ReadResourceResult) -> int:
+    """Resource读取结果的大小（字节），text按UTF-8编码计算，blob按base64字符串的长度计算，用于按大小淘汰"""
+    size = 0
+    for content in result.contents:
+        text = getattr(content, "text", None)
+        size += len(text.encode("utf-8")) if text is not None else len(getattr(content, "blob", ""))
+    return size
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, bool) or value is None:
+        return value
+    # 1.0和1对工具来说是同一个参数
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def canonical_arguments(arguments: dict[str, Any] | None) -> str:
+    """参数的规范化编码：key排序、数字归一化，内容相同的参数得到相同的字符串"""
+    return json.dumps(
+        _normalize(arguments or {}), sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+
+
+class ToolMemoizer:
+    """
+    纯函数Tool的调用结果缓存：同样的参数直接返回上一次的结果，不再请求服务端。
+    只有明确允许的Tool才会缓存：在tools中列出名字，或者use_annotations=True时，
+    Tool的annotations声明了readOnlyHint或idempotentHint
+    """
+    def __init__(
+        self,
+        tools: Iterable[str] = (),
+        use_annotations: bool = False,
+        ttl: float | None = None,
+        max_entries: int | None = 1024,
+    ):
+        self.tools = set(tools)
+        self.use_annotations = use_annotations
+        self.cache = LRUCache(max_bytes=None, max_entries=max_entries, default_ttl=ttl)
+
+    @classmethod
+    def from_config(cls, config: dict) -> "ToolMemoizer":
+        """
+        根据mcp_dicts中的memoize字段创建，例如：
+        "memoize": {"tools": ["plus_tool"], "annotations": true, "ttl": 60, "max_entries": 1024}
+        """
+        return cls(
+            tools=config.get("tools", ()),
+            use_annotations=config.get("annotations", False),
+            ttl=config.get("ttl"),
+            max_entries=config.get("max_entries", 1024),
+        )
+
+    @property
+    def hits(self) -> int:
+        return self.cache.hits
+
+    @property
+    def misses(self) -> int:
+        return self.cache.misses
+
+    def enabled_for(self, function: MCPFunction) -> bool:
+        if function.name in self.tools or function.origin_name in self.tools:
+            return True
+        annotations = function.annotations
+        if self.use_annotations and annotations is not None:
+            return bool(annotations.readOnlyHint or annotations.idempotentHint)
+        return False
+
+    @staticmethod
+    def make_key(server_name: str, function: MCPFunction, arguments: dict[str, Any] | None) -> tuple:
+        return server_name, function.origin_name, canonical_arguments(arguments)
+
+    def get(self, key: tuple) -> CallToolResult | None:
+        return self.cache.get(key)
+
+    def set(self, key: tuple, result: CallToolResult):
+        # 出错的结果不缓存
+        if not result.isError:
+            self.cache.set(key, result)
@@ -0,0 +1,81 @@
+# 用来把MCP Server的函数目录（Tool、Resource、Resource Template、Prompt）缓存到磁盘上
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any
+from models import MCPFunction
+
+
+def dump_functions(functions: dict[str, MCPFunction]) -> dict[str, dict[str, Any]]:
+    """把函数目录转换成可以JSON序列化、可以直接比较的字典"""
+    return {name: function.model_dump(mode="json") for name, function in functions.items()}
+
+
+class CatalogCache:
+    """
+    MCP Server函数目录的磁盘缓存。
+    缓存的key由Server的名字和启动配置（command、args、env的哈希、url）组成，
+    启动配置变了，缓存自然就失效了
+    """
+    def __init__(self, cache_dir: str | Path = "~/.cache/mcp_catalog"):
+        self.cache_dir = Path(cache_dir).expanduser()
+
+    @staticmethod
+    def make_key(name: str, mcp_dict: dict) -> str:
+        env = mcp_dict.get('env') or {}
+        # env里可能有密钥，只保存它的哈希
+        env_hash = hashlib.sha256(
+            json.dumps(env, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+        config = {
+            "name": name,
+            "command": mcp_dict.get('command'),
+            "args": mcp_dict.get('args'),
+            "env": env_hash,
+            "url": mcp_dict.get('url'),
+        }
+        return hashlib.sha256(
+            json.dumps(config, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+
+    def _path(self, name: str, key: str) -> Path:
+        # 文件名里保留Server的名字，方便人工查看
+        safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
+        return self.cache_dir / f"{safe_name}-{key[:16]}.json"
+
+    def load(self, name: str, mcp_dict: dict) -> dict[str, MCPFunction] | None:
+        """读取缓存，没有缓存或者缓存损坏时返回None"""
+        key = self.make_key(name, mcp_dict)
+        path = self._path(name, key)
+        try:
+            with open(path, mode='r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("key") != key:
+                return None
+            return {
+                function_name: MCPFunction.model_validate(function)
+                for function_name, function in data["functions"].items()
+            }
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, name: str, mcp_dict: dict, functions: dict[str, MCPFunction]):
+        key = self.make_key(name, mcp_dict)
+        path = self._path(name, key)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        data = {
+            "key": key,
+            "server_name": name,
+            "functions": dump_functions(functions),
+        }
+        # 先写临时文件再rename，保证其他进程读到的要么是旧文件，要么是完整的新文件
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp-", suffix=".json")
+        try:
+            with os.fdopen(fd, mode='w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
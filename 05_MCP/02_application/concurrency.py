@@ -0,0 +1,211 @@
+# 并发控制相关的工具类
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    """
+    合并相同的并发请求：同一个key同时只有一个请求在执行，
+    其他相同key的调用等待这个请求，拿到同样的结果或者同样的异常
+    """
+    def __init__(self):
+        # key -> [执行请求的任务, 等待者数量]
+        self._calls: dict[Hashable, list] = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._calls.get(key)
+        # 已经被取消（还没来得及清理）的请求不能再共享
+        if entry is None or entry[0].cancelling():
+            # 请求放在独立的任务中执行，某个等待者被取消不会影响其他等待者
+            task = asyncio.create_task(fn())
+            entry = [task, 0]
+            self._calls[key] = entry
+            task.add_done_callback(lambda _: self._remove(key, entry))
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # 最后一个等待者也取消了，就没有必要继续执行了
+            if entry[1] == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            entry[1] -= 1
+
+    def _remove(self, key: Hashable, entry: list):
+        if self._calls.get(key) is entry:
+            del self._calls[key]
+        task = entry[0]
+        if not task.cancelled():
+            # 标记异常已被读取，所有等待者都取消时也不会打印警告
+            task.exception()
+
+
+class Deadline:
+    """
+    一组操作共同的截止时间，比如Agent的一轮对话：前面的步骤用掉的时间越多，后面的步骤可用的时间就越少
+    """
+    def __init__(self, timeout: float):
+        """
+        :param timeout: 从现在开始还有多少秒
+        """
+        self.expires_at = time.monotonic() + timeout
+
+    def remaining(self) -> float:
+        """剩余的秒数，已经过了截止时间返回0"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def cap(self, timeout: float | None) -> float:
+        """单个操作的超时时间不能超过剩余的时间，timeout为None时就是剩余的时间"""
+        remaining = self.remaining()
+        return remaining if timeout is None else min(timeout, remaining)
+
+
+class OverloadedError(RuntimeError):
+    """准入控制拒绝了调用：排队的调用太多，或者排队超时"""
+    pass
+
+
+class TokenBucket:
+    """令牌桶限流：平均每秒rate个请求，最多允许burst个请求的突发"""
+    def __init__(self, rate: float, burst: int | None = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """预定一个令牌，返回需要等待的秒数。令牌可以透支，后面的调用需要等待更久"""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        return max(0.0, -self._tokens / self.rate)
+
+    def cancel(self):
+        """归还reserve预定的令牌"""
+        self._tokens += 1
+
+
+class AdmissionController:
+    """
+    单个Server的准入控制：同时进行的调用数量上限、有界的等待队列，以及可选的令牌桶限流。
+    队列满了或者排队超时的调用会立即抛出OverloadedError，不会继续堆积
+    """
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int | None = None,
+        max_queue: int | None = 64,
+        queue_timeout: float | None = None,
+        rate: float | None = None,
+        burst: int | None = None,
+    ):
+        """
+        :param name: Server的名字，用于错误信息
+        :param max_concurrency: 同时进行的调用数量上限，None表示不限制
+        :param max_queue: 最多有多少个调用排队等待，超过后直接拒绝；0表示不排队，None表示不限制
+        :param queue_timeout: 最多排队等待多少秒，超过后拒绝，None表示一直等待（仍然受调用的超时时间限制）
+        :param rate: 每秒最多发起多少个调用，None表示不限流
+        :param burst: 令牌桶的容量，允许的突发调用数量，默认等于rate
+        """
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency is not None else None
+        self._bucket = TokenBucket(rate, burst) if rate is not None else None
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @classmethod
+    def from_config(cls, name: str, config: dict) -> "AdmissionController":
+        """
+        根据mcp_dicts中的limits配置创建，比如：
+        {"max_concurrency": 4, "max_queue": 16, "queue_timeout": 5, "rate": 10, "burst": 20}
+        """
+        return cls(name, **config)
+
+    def _must_wait(self) -> bool:
+        return self._semaphore is not None and self._semaphore.locked()
+
+    async def _wait(self, wait: float | None):
+        """等待令牌和并发名额，wait是令牌桶要求的等待时间"""
+        if wait:
+            await asyncio.sleep(wait)
+        if self._semaphore is not None:
+            await self._semaphore.acquire()
+
+    @asynccontextmanager
+    async def slot(self):
+        """占用一个调用名额，退出时归还"""
+        wait = self._bucket.reserve() if self._bucket is not None else 0.0
+        try:
+            await self._admit(wait)
+        except BaseException:
+            # 被拒绝、排队超时、在排队时被取消或者超时，都没有真正发起调用，预定的令牌还回去，
+            # 否则令牌桶会一直透支，后面的调用被限制在rate以下
+            if self._bucket is not None:
+                self._bucket.cancel()
+            raise
+        self.admitted += 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+    async def _admit(self, wait: float):
+        """排队等待令牌和并发名额，返回时已经占用了并发名额"""
+        if wait or self._must_wait():
+            if self.max_queue is not None and self.queue_depth >= self.max_queue:
+                self.rejected += 1
+                raise OverloadedError(f"MCP Server {self.name} 过载：已经有{self.queue_depth}个调用在排队")
+            if self.queue_timeout is not None and wait > self.queue_timeout:
+                self.rejected += 1
+                raise OverloadedError(f"MCP Server {self.name} 超过了限流速度，需要等待{wait:.3g}秒")
+            self.queue_depth += 1
+            start = time.monotonic()
+            try:
+                async with asyncio.timeout(self.queue_timeout):
+                    await self._wait(wait)
+            except TimeoutError:
+                self.rejected += 1
+                raise OverloadedError(
+                    f"MCP Server {self.name} 过载：排队超过{self.queue_timeout:.3g}秒"
+                ) from None
+            finally:
+                self.queue_depth -= 1
+            waited = time.monotonic() - start
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+        elif self._semaphore is not None:
+            # 有空闲名额，acquire不会等待
+            await self._semaphore.acquire()
+
+    def stats(self) -> dict[str, Any]:
+        """当前的排队情况，用来调整limits配置"""
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "average_wait": self.total_wait / self.admitted if self.admitted else 0.0,
+            "max_wait": self.max_wait,
+        }
@@ -0,0 +1,119 @@
+# 异步、流式的大模型调用：边接收边输出token，并且在流中逐步拼出tool_calls
+from openai import AsyncOpenAI
+from typing import Any, Callable
+from tracing import get_tracer
+import json
+
+
+class LLMResponse:
+    """一次流式补全拼装出来的结果"""
+    def __init__(self):
+        self.content = ""
+        self.finish_reason: str | None = None
+        # 按index排列的tool_calls，格式和OpenAI的assistant消息一致
+        self.tool_calls: list[dict[str, Any]] = []
+
+    def to_message(self) -> dict[str, Any]:
+        message: dict[str, Any] = {"role": "assistant", "content": self.content or None}
+        if self.tool_calls:
+            message["tool_calls"] = self.tool_calls
+        return message
+
+
+class StreamingLLM:
+    def __init__(self, client: AsyncOpenAI, model: str = "deepseek-chat"):
+        self.client = client
+        self.model = model
+
+    async def complete(
+        self,
+        messages: list[dict[str, Any]],
+        tools: list[dict[str, Any]] | None = None,
+        on_token: Callable[[str], None] | None = None,
+        on_tool_call: Callable[[dict[str, Any]], None] | None = None,
+    ) -> LLMResponse:
+        """
+        流式调用大模型
+        :param on_token: 每收到一段文本内容就调用一次
+        :param on_tool_call: 每个tool_call的参数完整后立即调用一次（不用等整个补全结束），
+            参数能解析成完整的JSON对象，或者下一个tool_call开始了，就认为这个tool_call完整了
+        """
+        attributes = {"llm.model": self.model, "llm.messages": len(messages), "llm.tools": len(tools or ())}
+        with get_tracer().start_span("StreamingLLM.complete", attributes) as span:
+            response = await self._complete(messages, tools, on_token, on_tool_call)
+            span.set_attribute("llm.finish_reason", response.finish_reason or "")
+            span.set_attribute("llm.tool_calls", len(response.tool_calls))
+            return response
+
+    async def _complete(
+        self,
+        messages: list[dict[str, Any]],
+        tools: list[dict[str, Any]] | None,
+        on_token: Callable[[str], None] | None,
+        on_tool_call: Callable[[dict[str, Any]], None] | None,
+    ) -> LLMResponse:
+        kwargs: dict[str, Any] = {}
+        if tools:
+            kwargs["tools"] = tools
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True,
+            **kwargs
+        )
+        response = LLMResponse()
+        # index -> tool_call，以及已经通知过on_tool_call的index
+        tool_calls: dict[int, dict[str, Any]] = {}
+        emitted: set[int] = set()
+
+        def emit(index: int):
+            if index in emitted:
+                return
+            emitted.add(index)
+            if on_tool_call is not None:
+                on_tool_call(tool_calls[index])
+
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            delta = choice.delta
+            if delta.content:
+                response.content += delta.content
+                if on_token is not None:
+                    on_token(delta.content)
+            for tool_call_delta in delta.tool_calls or []:
+                index = tool_call_delta.index
+                tool_call = tool_calls.get(index)
+                if tool_call is None:
+                    # 新的tool_call开始了，之前的tool_call一定已经完整
+                    for previous in tool_calls:
+                        emit(previous)
+                    tool_call = tool_calls[index] = {
+                        "id": tool_call_delta.id or f"call_{index}",
+                        "type": "function",
+                        "function": {"name": "", "arguments": ""},
+                    }
+                function = tool_call_delta.function
+                if function is not None:
+                    if function.name:
+                        tool_call["function"]["name"] += function.name
+                    if function.arguments:
+                        tool_call["function"]["arguments"] += function.arguments
+                        if _is_complete(tool_call["function"]["arguments"]):
+                            emit(index)
+            if choice.finish_reason:
+                response.finish_reason = choice.finish_reason
+
+        for index in tool_calls:
+            emit(index)
+        response.tool_calls = [tool_calls[index] for index in sorted(tool_calls)]
+        return response
+
+
+def _is_complete(arguments: str) -> bool:
+    # 顶层是JSON对象，能解析成功说明右括号已经到了，后面不会再有内容
+    try:
+        return isinstance(json.loads(arguments), dict)
+    except ValueError:
+        return False
@@ -0,0 +1,186 @@
+# MCP调用的延迟和吞吐统计：按Server、函数记录各阶段耗时的直方图、结果大小、错误数和进行中的调用数，
+# 可以导出成Prometheus的文本格式，也可以在进程内取快照
+from bisect import bisect_left
+from typing import Any
+import asyncio
+
+# 耗时的桶（秒），和Prometheus客户端默认的桶接近
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 结果大小的桶（字符数）
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+# 记录的阶段：连接（建立stdio/SSE传输）、握手（initialize）、获取函数目录、函数调用
+PHASES = ("connect", "handshake", "discovery", "call")
+
+
+class Histogram:
+    """固定桶的直方图，observe只做一次二分查找和几个计数"""
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        # 最后一个是+Inf桶；counts不是累计的，导出时再累加
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def percentile(self, p: float) -> float:
+        """用桶的上界估计分位数，落在+Inf桶时返回最大的桶上界"""
+        if not self.count:
+            return 0.0
+        rank = p * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return self.buckets[-1]
+
+
+class MCPMetrics:
+    """
+    MCP调用的统计。创建MCPServerManager（或MCPServer）时传入metrics参数就会开始记录，
+    同一个MCPMetrics可以被多个Manager共享
+    """
+    def __init__(self):
+        # (阶段, Server名, 函数名) -> 耗时直方图，连接、握手、获取函数目录的函数名是空字符串
+        self.latencies: dict[tuple[str, str, str], Histogram] = {}
+        # (Server名, 函数名) -> 结果大小直方图
+        self.payload_sizes: dict[tuple[str, str], Histogram] = {}
+        # (阶段, Server名, 函数名, 异常类名) -> 次数
+        self.errors: dict[tuple[str, str, str, str], int] = {}
+        # Server名 -> 进行中的调用数
+        self.in_flight: dict[str, int] = {}
+
+    def observe(self, phase: str, server: str, seconds: float, function: str = ""):
+        key = (phase, server, function)
+        histogram = self.latencies.get(key)
+        if histogram is None:
+            histogram = self.latencies[key] = Histogram(LATENCY_BUCKETS)
+        histogram.observe(seconds)
+
+    def observe_payload(self, server: str, function: str, size: int):
+        key = (server, function)
+        histogram = self.payload_sizes.get(key)
+        if histogram is None:
+            histogram = self.payload_sizes[key] = Histogram(SIZE_BUCKETS)
+        histogram.observe(size)
+
+    def error(self, phase: str, server: str, error: BaseException | str, function: str = ""):
+        """:param error: 异常，或者异常类名"""
+        key = (phase, server, function, error if isinstance(error, str) else type(error).__name__)
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+    def call_started(self, server: str):
+        self.in_flight[server] = self.in_flight.get(server, 0) + 1
+
+    def call_finished(self, server: str):
+        self.in_flight[server] -= 1
+
+    def snapshot(self) -> dict[str, Any]:
+        """进程内的快照：每个(阶段, Server, 函数)的次数、平均耗时和估计的p50/p95/p99"""
+        latencies = [
+            {
+                "phase": phase,
+                "server": server,
+                "function": function,
+                "count": histogram.count,
+                "average": histogram.sum / histogram.count if histogram.count else 0.0,
+                "p50": histogram.percentile(0.5),
+                "p95": histogram.percentile(0.95),
+                "p99": histogram.percentile(0.99),
+            }
+            for (phase, server, function), histogram in self.latencies.items()
+        ]
+        payload_sizes = [
+            {
+                "server": server,
+                "function": function,
+                "count": histogram.count,
+                "average": histogram.sum / histogram.count if histogram.count else 0.0,
+            }
+            for (server, function), histogram in self.payload_sizes.items()
+        ]
+        errors = [
+            {"phase": phase, "server": server, "function": function, "error": error, "count": count}
+            for (phase, server, function, error), count in self.errors.items()
+        ]
+        return {
+            "latencies": latencies,
+            "payload_sizes": payload_sizes,
+            "errors": errors,
+            "in_flight": dict(self.in_flight),
+        }
+
+    def render_prometheus(self) -> str:
+        """Prometheus的文本格式"""
+        lines = [
+            "# HELP mcp_latency_seconds MCP connect/handshake/discovery/call latency",
+            "# TYPE mcp_latency_seconds histogram",
+        ]
+        for (phase, server, function), histogram in self.latencies.items():
+            labels = f'phase="{_escape(phase)}",server="{_escape(server)}",function="{_escape(function)}"'
+            _render_histogram(lines, "mcp_latency_seconds", labels, histogram)
+        lines += [
+            "# HELP mcp_payload_size MCP call result size in characters",
+            "# TYPE mcp_payload_size histogram",
+        ]
+        for (server, function), histogram in self.payload_sizes.items():
+            labels = f'server="{_escape(server)}",function="{_escape(function)}"'
+            _render_histogram(lines, "mcp_payload_size", labels, histogram)
+        lines += [
+            "# HELP mcp_errors_total MCP errors",
+            "# TYPE mcp_errors_total counter",
+        ]
+        for (phase, server, function, error), count in self.errors.items():
+            lines.append(
+                f'mcp_errors_total{{phase="{_escape(phase)}",server="{_escape(server)}",'
+                f'function="{_escape(function)}",error="{_escape(error)}"}} {count}'
+            )
+        lines += [
+            "# HELP mcp_in_flight MCP calls in flight",
+            "# TYPE mcp_in_flight gauge",
+        ]
+        for server, count in self.in_flight.items():
+            lines.append(f'mcp_in_flight{{server="{_escape(server)}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    async def serve_prometheus(self, host: str = "127.0.0.1", port: int = 9464) -> asyncio.Server:
+        """
+        启动一个最简单的HTTP服务，任何路径都返回render_prometheus()的内容，供Prometheus抓取。
+        返回asyncio.Server，调用close()停止
+        """
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            try:
+                # 只需要读完请求头，内容和路径都不关心
+                await reader.readuntil(b"\r\n\r\n")
+                body = self.render_prometheus().encode("utf-8")
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                    b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                    b"Connection: close\r\n\r\n" + body
+                )
+                await writer.drain()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+
+        return await asyncio.start_server(handle, host, port)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _render_histogram(lines: list[str], name: str, labels: str, histogram: Histogram):
+    total = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        total += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {total}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
@@ -1,8 +1,13 @@
       
 from pydantic import BaseModel
+from dataclasses import dataclass, field
 from enum import Enum
 from typing import Any
-from mcp.types import AnyUrl, PromptArgument
+from mcp.types import (
+    AnyUrl, AudioContent, BlobResourceContents, CallToolResult, EmbeddedResource, GetPromptResult, ImageContent,
+    PromptArgument, ReadResourceResult, TextContent, TextResourceContents, ToolAnnotations,
+)
+import binascii
 
 class MCPFunctionType(Enum):
     TOOL = "tool"
@@ -19,9 +24,120 @@ class MCPFunction(BaseModel):
     type_: MCPFunctionType
     # input_schema：是Tool独有的属性
     input_schema: dict[str, Any] | None = None
+    # annotations：也是Tool独有的属性，比如readOnlyHint、idempotentHint
+    annotations: ToolAnnotations | None = None
     # uri：是Resource/Resource Template独有的属性
     uri: str | AnyUrl | None = None
     # arguments：是prompt独有的属性
     arguments: list[PromptArgument] | None = None
 
-    
\ No newline at end of file
+
+@dataclass
+class MCPCallResult:
+    """批量调用中单个调用的结果"""
+    # 在批量调用列表中的位置
+    index: int
+    name: str
+    arguments: dict[str, Any] | None
+    result: Any = None
+    # 调用失败时的异常，成功时为None
+    error: BaseException | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class MCPContent:
+    """
+    结果中的一个部分：文本，或者二进制（图片、音频、blob资源）。
+    二进制内容保存的是base64字符串，第一次访问data时才解码
+    """
+    # text、image、audio、resource（嵌入的资源、Resource读取的结果）、resource_link
+    type_: str
+    text: str | None = None
+    mime_type: str | None = None
+    uri: str | None = None
+    # Prompt消息的角色：user、assistant
+    role: str | None = None
+    base64: str | None = field(default=None, repr=False)
+    _data: memoryview | None = field(default=None, repr=False)
+
+    @property
+    def is_binary(self) -> bool:
+        return self.base64 is not None or self._data is not None
+
+    @property
+    def data(self) -> memoryview | None:
+        """解码后的二进制内容，切片不会复制数据；文本内容返回None"""
+        if self._data is None and self.base64 is not None:
+            # a2b_base64可以直接解码str，不需要先encode成bytes再解码
+            self._data = memoryview(binascii.a2b_base64(self.base64))
+            self.base64 = None
+        return self._data
+
+    @property
+    def size(self) -> int:
+        """文本的字符数，或者二进制的字节数（还没解码时按base64长度估算）"""
+        if self.text is not None:
+            return len(self.text)
+        if self._data is not None:
+            return self._data.nbytes
+        return len(self.base64) * 3 // 4 if self.base64 is not None else 0
+
+
+@dataclass
+class MCPResult:
+    """函数调用的完整结果：所有的内容部分、Tool的structuredContent，以及是否出错"""
+    contents: list[MCPContent]
+    structured_content: dict[str, Any] | None = None
+    is_error: bool = False
+
+    @property
+    def text(self) -> str:
+        """所有文本部分拼起来的内容"""
+        return "\n".join(content.text for content in self.contents if content.text is not None)
+
+    @property
+    def blobs(self) -> list[MCPContent]:
+        return [content for content in self.contents if content.is_binary]
+
+    @property
+    def size(self) -> int:
+        return sum(content.size for content in self.contents)
+
+    @classmethod
+    def from_response(cls, response: "CallToolResult | ReadResourceResult | GetPromptResult | MCPResult") -> "MCPResult":
+        """把MCP的CallToolResult、ReadResourceResult、GetPromptResult转换成MCPResult"""
+        if isinstance(response, MCPResult):
+            return response
+        if isinstance(response, CallToolResult):
+            return cls(
+                [_content(part) for part in response.content],
+                structured_content=response.structuredContent,
+                is_error=response.isError,
+            )
+        if isinstance(response, ReadResourceResult):
+            return cls([_resource_content(part) for part in response.contents])
+        return cls([_content(message.content, role=message.role) for message in response.messages])
+
+
+def _resource_content(part: TextResourceContents | BlobResourceContents, type_: str = "resource") -> MCPContent:
+    if isinstance(part, TextResourceContents):
+        return MCPContent(type_, text=part.text, mime_type=part.mimeType, uri=str(part.uri))
+    return MCPContent(type_, base64=part.blob, mime_type=part.mimeType, uri=str(part.uri))
+
+
+def _content(part, role: str | None = None) -> MCPContent:
+    if isinstance(part, TextContent):
+        content = MCPContent("text", text=part.text)
+    elif isinstance(part, (ImageContent, AudioContent)):
+        content = MCPContent(part.type, base64=part.data, mime_type=part.mimeType)
+    elif isinstance(part, EmbeddedResource):
+        content = _resource_content(part.resource)
+    else:
+        # ResourceLink：只有uri，内容需要再读取
+        content = MCPContent(part.type, mime_type=getattr(part, "mimeType", None), uri=str(getattr(part, "uri", "")))
+    content.role = role
+    return content
@@ -0,0 +1,209 @@
+# 应对慢或者故障的MCP Server：熔断器，以及对冲请求用到的延迟统计
+from collections import deque
+from contextlib import asynccontextmanager
+from enum import Enum
+from typing import Any, Callable
+from mcp.shared.exceptions import McpError
+from mcp.types import INVALID_PARAMS
+from concurrency import OverloadedError
+from uri_template import UriTemplateError
+import asyncio
+import time
+
+
+class LatencyWindow:
+    """最近size次调用的耗时（秒），用来计算延迟的分位数"""
+    def __init__(self, size: int = 100):
+        self._samples: deque[float] = deque(maxlen=size)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> float:
+        """p取0-1，比如0.95就是p95，没有样本时返回0"""
+        if not self._samples:
+            return 0.0
+        samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def is_caller_error(e: BaseException) -> bool:
+    """
+    是否是调用方参数错误导致的异常：发请求之前客户端就发现的参数错误（UriTemplateError），
+    以及服务端校验参数失败返回的INVALID_PARAMS。这类错误不能说明Server有问题。
+    其他ValueError（比如服务端返回的结果不合法时的ValidationError、JSONDecodeError）仍然算作Server的故障
+    """
+    if isinstance(e, McpError):
+        return e.error.code == INVALID_PARAMS
+    return isinstance(e, UriTemplateError)
+
+
+class CircuitState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断器处于打开状态，调用没有发给MCP Server"""
+    pass
+
+
+class CircuitBreaker:
+    """
+    单个Server的熔断器。
+    closed：正常调用，统计最近window次调用的失败率和延迟分位数，超过阈值就打开；
+    open：直接抛出CircuitOpenError，不再等待故障的Server，open_duration秒后进入half_open；
+    half_open：放行half_open_calls个试探调用，都成功就关闭，任何一个失败就重新打开
+    """
+    def __init__(
+        self,
+        name: str,
+        window: int = 50,
+        min_calls: int = 10,
+        failure_threshold: float = 0.5,
+        latency_threshold: float | None = None,
+        latency_percentile: float = 0.95,
+        open_duration: float = 30,
+        half_open_calls: int = 1,
+    ):
+        """
+        :param name: Server的名字，用于错误信息
+        :param window: 统计最近多少次调用
+        :param min_calls: 统计的调用次数少于min_calls时不会打开
+        :param failure_threshold: 失败率达到多少时打开（0-1）
+        :param latency_threshold: 延迟分位数超过多少秒时打开，None表示不根据延迟熔断
+        :param latency_percentile: 和latency_threshold比较的分位数，比如0.95就是p95
+        :param open_duration: 打开后多少秒进入half_open
+        :param half_open_calls: half_open状态下的试探调用数量
+        """
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_threshold = failure_threshold
+        self.latency_threshold = latency_threshold
+        self.latency_percentile = latency_percentile
+        self.open_duration = open_duration
+        self.half_open_calls = half_open_calls
+        self.state = CircuitState.CLOSED
+        # 最近的调用：(耗时, 是否失败)
+        self._calls: deque[tuple[float, bool]] = deque(maxlen=window)
+        self._failures = 0
+        self._latencies = LatencyWindow(window)
+        self._opened_at = 0.0
+        # half_open状态下正在进行的、已经成功的试探调用数量
+        self._probes = 0
+        self._probe_successes = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_config(cls, name: str, config: dict) -> "CircuitBreaker":
+        """
+        根据mcp_dicts中的circuit_breaker配置创建，比如：
+        {"failure_threshold": 0.5, "latency_threshold": 5, "open_duration": 30}
+        """
+        return cls(name, **config)
+
+    @property
+    def failure_rate(self) -> float:
+        return self._failures / len(self._calls) if self._calls else 0.0
+
+    def _before_call(self) -> bool:
+        """检查是否放行，返回这次调用是不是half_open状态下的试探调用"""
+        if self.state == CircuitState.OPEN:
+            remaining = self._opened_at + self.open_duration - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError(f"MCP Server {self.name} 已熔断，{remaining:.3g}秒后再试")
+            self.state = CircuitState.HALF_OPEN
+            self._probes = 0
+            self._probe_successes = 0
+        if self.state == CircuitState.HALF_OPEN:
+            if self._probes >= self.half_open_calls:
+                self.rejected += 1
+                raise CircuitOpenError(f"MCP Server {self.name} 已熔断，正在试探是否恢复")
+            self._probes += 1
+            return True
+        return False
+
+    def check(self):
+        """已经熔断时抛出CircuitOpenError，不改变状态，用于排队之前快速失败"""
+        if self.state == CircuitState.OPEN:
+            remaining = self._opened_at + self.open_duration - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError(f"MCP Server {self.name} 已熔断，{remaining:.3g}秒后再试")
+        elif self.state == CircuitState.HALF_OPEN and self._probes >= self.half_open_calls:
+            self.rejected += 1
+            raise CircuitOpenError(f"MCP Server {self.name} 已熔断，正在试探是否恢复")
+
+    @asynccontextmanager
+    async def guard(self, timed_out: Callable[[], bool] | None = None):
+        """
+        包住一次调用，根据调用的结果和耗时更新熔断器的状态
+        :param timed_out: 调用被取消时，判断是不是因为超时，超时算作失败，其他原因的取消不计入统计
+        """
+        probe = self._before_call()
+        start = time.monotonic()
+        try:
+            yield
+        except (asyncio.CancelledError, Exception) as e:
+            if isinstance(e, asyncio.CancelledError) and timed_out is not None and timed_out():
+                self._record(time.monotonic() - start, True, probe)
+            elif isinstance(e, (asyncio.CancelledError, OverloadedError)) or is_caller_error(e):
+                # 被取消、被准入控制拒绝、参数错误的调用不能说明Server有问题，不计入统计，试探的名额还回去
+                if probe and self.state == CircuitState.HALF_OPEN:
+                    self._probes -= 1
+            else:
+                self._record(time.monotonic() - start, True, probe)
+            raise
+        self._record(time.monotonic() - start, False, probe)
+
+    def _record(self, seconds: float, failed: bool, probe: bool):
+        if probe and self.latency_threshold is not None and seconds > self.latency_threshold:
+            # 试探调用太慢也算失败
+            failed = True
+        if probe:
+            if self.state != CircuitState.HALF_OPEN:
+                return
+            if failed:
+                self._open()
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_calls:
+                self._close()
+            return
+        if self.state != CircuitState.CLOSED:
+            return
+        if len(self._calls) == self._calls.maxlen and self._calls[0][1]:
+            self._failures -= 1
+        self._calls.append((seconds, failed))
+        self._failures += failed
+        self._latencies.add(seconds)
+        if len(self._calls) < self.min_calls:
+            return
+        if self.failure_rate >= self.failure_threshold:
+            self._open()
+        elif (self.latency_threshold is not None
+              and self._latencies.percentile(self.latency_percentile) > self.latency_threshold):
+            self._open()
+
+    def _open(self):
+        self.state = CircuitState.OPEN
+        self._opened_at = time.monotonic()
+
+    def _close(self):
+        self.state = CircuitState.CLOSED
+        self._calls.clear()
+        self._failures = 0
+        self._latencies = LatencyWindow(self._calls.maxlen)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "state": self.state.value,
+            "failure_rate": self.failure_rate,
+            "latency_percentile": self._latencies.percentile(self.latency_percentile),
+            "rejected": self.rejected,
+        }
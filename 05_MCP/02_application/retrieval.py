@@ -0,0 +1,131 @@
+# 本地的函数检索索引：根据用户的问题，只挑选相关的函数发给大模型，减少提示词的token数
+from collections import Counter
+from typing import Iterable
+from models import MCPFunction
+from schema import is_chunked
+import heapq
+import math
+import re
+
+_WORD = re.compile(r"[a-z0-9]+")
+_CJK = re.compile(r"[一-鿿]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    分词：英文和数字按单词切分（下划线、驼峰都会拆开），较长的单词再加上字符3-gram以支持部分匹配；
+    中文没有空格，使用单字和相邻两个字（bigram）
+    """
+    # 驼峰拆开：readFile -> read File
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text).lower()
+    tokens = []
+    for word in _WORD.findall(text):
+        tokens.append(word)
+        if len(word) > 3:
+            tokens.extend(f"#{word[i:i + 3]}" for i in range(len(word) - 2))
+    for run in _CJK.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def function_text(function: MCPFunction) -> str:
+    """用来建索引的文本：函数名、描述，以及参数名"""
+    parts = [function.name, function.description or ""]
+    if function.input_schema:
+        parts.extend(function.input_schema.get("properties", {}))
+    if function.arguments:
+        parts.extend(argument.name for argument in function.arguments)
+    return " ".join(parts)
+
+
+class FunctionIndex:
+    """
+    基于BM25的倒排索引，纯Python实现，不需要网络。
+    支持增量地添加、删除文档，sync()可以直接和MCPServerManager.all_functions对齐
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # term -> {文档名: 词频}
+        self._postings: dict[str, dict[str, int]] = {}
+        # 文档名 -> (文档长度, 建索引用的文本)
+        self._docs: dict[str, tuple[int, str]] = {}
+        self._total_length = 0
+        self._synced_source: dict[str, MCPFunction] | None = None
+        self._synced_size = 0
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, name: str):
+        return name in self._docs
+
+    def add(self, name: str, text: str):
+        """添加文档，同名的文档已经存在且文本相同时什么都不做"""
+        existing = self._docs.get(name)
+        if existing is not None:
+            if existing[1] == text:
+                return
+            self.remove(name)
+        counts = Counter(tokenize(text))
+        length = sum(counts.values())
+        for term, count in counts.items():
+            self._postings.setdefault(term, {})[name] = count
+        self._docs[name] = (length, text)
+        self._total_length += length
+
+    def remove(self, name: str):
+        existing = self._docs.pop(name, None)
+        if existing is None:
+            return
+        length, text = existing
+        self._total_length -= length
+        for term in set(tokenize(text)):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(name, None)
+            if not postings:
+                del self._postings[term]
+
+    def sync(self, functions: dict[str, MCPFunction]):
+        """和函数目录对齐：新增、修改的函数重新建索引，已经不存在的函数、分块读取的Resource Template删掉"""
+        if functions is self._synced_source and len(functions) == self._synced_size:
+            return
+        for name in [name for name in self._docs if name not in functions or is_chunked(functions[name])]:
+            self.remove(name)
+        for name, function in functions.items():
+            if not is_chunked(function):
+                self.add(name, function_text(function))
+        self._synced_source = functions
+        self._synced_size = len(functions)
+
+    def search(self, query: str, k: int = 10) -> list[tuple[str, float]]:
+        """返回和query最相关的k个文档：[(文档名, 分数), ...]，分数从高到低"""
+        if not self._docs:
+            return []
+        doc_count = len(self._docs)
+        average_length = self._total_length / doc_count or 1
+        scores: dict[str, float] = {}
+        for term, query_count in Counter(tokenize(query)).items():
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for name, count in postings.items():
+                length = self._docs[name][0]
+                norm = count + self.k1 * (1 - self.b + self.b * length / average_length)
+                scores[name] = scores.get(name, 0.0) + query_count * idf * count * (self.k1 + 1) / norm
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def top_names(self, query: str, k: int = 10, always: Iterable[str] = ()) -> list[str]:
+        """
+        相关的函数名列表
+        :param always: 无论是否相关都要包含的函数名
+        """
+        names = [name for name in always if name in self._docs]
+        for name, _ in self.search(query, k):
+            if name not in names:
+                names.append(name)
+        return names
@@ -0,0 +1,158 @@
+# 把MCP的函数目录转换成大模型Function Calling格式的tools，并缓存转换和序列化的结果
+from typing import Any, Callable
+from models import MCPFunction, MCPFunctionType
+import json
+import re
+
+
+def template_variables(uri_template: str) -> list[str]:
+    """uri模板中的变量名，比如file://data/{grade}.json -> ['grade']，{+path}、{a,b}也能处理"""
+    names = []
+    for expression in re.findall(r"{([^}]+)}", uri_template):
+        for name in expression.lstrip("+#./;?&").split(","):
+            name = name.rstrip("*").split(":")[0]
+            if name and name not in names:
+                names.append(name)
+    return names
+
+
+def is_chunked(function: MCPFunction) -> bool:
+    """
+    是否是带offset和length参数、按字节分块读取的Resource Template。
+    这种函数返回的是二进制分块，由MCPServer.read_chunks使用，不发给大模型
+    """
+    return function.type_ == MCPFunctionType.RESOURCE_TEMPLATE and {"offset", "length"} <= set(
+        template_variables(str(function.uri))
+    )
+
+
+def function_parameters(function: MCPFunction) -> dict[str, Any]:
+    """MCP函数对应的JSON Schema参数定义"""
+    if function.type_ == MCPFunctionType.TOOL:
+        return function.input_schema or {"type": "object", "properties": {}}
+    if function.type_ == MCPFunctionType.RESOURCE_TEMPLATE:
+        # uri模板中的占位符就是参数
+        names = template_variables(str(function.uri))
+        return {
+            "type": "object",
+            "properties": {name: {"type": "string"} for name in names},
+            "required": names,
+        }
+    if function.type_ == MCPFunctionType.PROMPT:
+        arguments = function.arguments or []
+        return {
+            "type": "object",
+            "properties": {
+                argument.name: {"type": "string", "description": argument.description or ""}
+                for argument in arguments
+            },
+            "required": [argument.name for argument in arguments if argument.required],
+        }
+    return {"type": "object", "properties": {}}
+
+
+def _collapse(text: str | None) -> str | None:
+    return " ".join(text.split()) if text else text
+
+
+# 值是 名字 -> 子schema 的关键字，名字可能就叫title，只处理子schema
+_SCHEMA_MAP_KEYWORDS = {"properties", "patternProperties", "$defs", "definitions", "dependentSchemas"}
+# 值是子schema或者子schema列表的关键字
+_SCHEMA_KEYWORDS = {
+    "items", "prefixItems", "additionalItems", "additionalProperties", "unevaluatedItems", "unevaluatedProperties",
+    "contains", "propertyNames", "not", "if", "then", "else", "anyOf", "oneOf", "allOf",
+}
+
+
+def minify_schema(schema: Any) -> Any:
+    """
+    去掉JSON Schema中的title，并压缩description中的空白，减少提示词的token数。
+    只递归处理子schema，default、const、enum、examples等关键字的值是数据，原样保留
+    """
+    if isinstance(schema, list):
+        return [minify_schema(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    result = {}
+    for key, value in schema.items():
+        if key == "title" and isinstance(value, str):
+            continue
+        if key == "description" and isinstance(value, str):
+            result[key] = _collapse(value)
+        elif key in _SCHEMA_MAP_KEYWORDS and isinstance(value, dict):
+            result[key] = {name: minify_schema(sub_schema) for name, sub_schema in value.items()}
+        elif key in _SCHEMA_KEYWORDS:
+            result[key] = minify_schema(value)
+        else:
+            result[key] = value
+    return result
+
+
+def build_tools(functions: dict[str, MCPFunction], minify: bool = False) -> list[dict[str, Any]]:
+    """把MCP的函数转换成Function Calling格式的tools，分块读取的Resource Template除外"""
+    tools = []
+    for function in functions.values():
+        if is_chunked(function):
+            continue
+        description = function.description
+        parameters = function_parameters(function)
+        if minify:
+            description = _collapse(description)
+            parameters = minify_schema(parameters)
+        tools.append({
+            "type": "function",
+            "function": {
+                "name": function.name,
+                "description": description,
+                "parameters": parameters,
+            }
+        })
+    return tools
+
+
+class ToolSchemaCatalog:
+    """
+    缓存的tools目录：函数目录不变时，直接返回上一次转换好的tools和序列化好的JSON，
+    MCPServerManager替换all_functions（目录变化）后才会重新构建
+    """
+    def __init__(self, get_functions: Callable[[], dict[str, MCPFunction]], minify: bool = False):
+        """
+        :param get_functions: 返回当前函数目录的函数，比如lambda: manager.all_functions
+        :param minify: 是否精简schema（去掉title、压缩description中的空白）
+        """
+        self.get_functions = get_functions
+        self.minify = minify
+        # 构建缓存时的函数目录，目录对象换了就说明需要重新构建
+        self._source: dict[str, MCPFunction] | None = None
+        self._source_size = 0
+        self._tools: list[dict[str, Any]] = []
+        self._tools_by_name: dict[str, dict[str, Any]] = {}
+        self._tools_json: bytes = b"[]"
+
+    def _refresh(self):
+        functions = self.get_functions()
+        # 串行初始化时all_functions是原地update的，所以还要比较大小
+        if functions is self._source and len(functions) == self._source_size:
+            return
+        self._tools = build_tools(functions, minify=self.minify)
+        self._tools_by_name = {tool["function"]["name"]: tool for tool in self._tools}
+        self._tools_json = json.dumps(
+            self._tools, ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+        self._source = functions
+        self._source_size = len(functions)
+
+    def tools(self) -> list[dict[str, Any]]:
+        """Function Calling格式的tools，调用方不要修改返回的列表"""
+        self._refresh()
+        return self._tools
+
+    def tools_json(self) -> bytes:
+        """序列化好的tools（UTF-8编码的JSON），可以直接拼到请求体中"""
+        self._refresh()
+        return self._tools_json
+
+    def subset(self, names: list[str]) -> list[dict[str, Any]]:
+        """只返回指定名字的tools，顺序和names一致"""
+        self._refresh()
+        return [self._tools_by_name[name] for name in names if name in self._tools_by_name]
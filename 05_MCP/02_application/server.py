@@ -1,15 +1,28 @@
       
 # 用来存放一些和服务器交互的类
 from enum import Enum
-from typing import Any
+from typing import Any, AsyncIterator, Awaitable, Callable
 from mcp.client.stdio import stdio_client, StdioServerParameters
-from contextlib import AsyncExitStack
+from contextlib import AsyncExitStack, contextmanager
+from contextvars import ContextVar
 from mcp.client.session import ClientSession
-from models import MCPFunction, MCPFunctionType
+from models import MCPCallResult, MCPFunction, MCPFunctionType, MCPResult
+from catalog import CatalogCache, dump_functions
+from cache import LRUCache, ToolMemoizer, canonical_arguments, resource_size
+from concurrency import AdmissionController, Deadline, SingleFlight
+from schema import ToolSchemaCatalog, is_chunked
+from uri_template import UriTemplate, UriTemplateError, UriTemplateRouter
+from resilience import CircuitBreaker, LatencyWindow
+from metrics import MCPMetrics
+from tracing import get_tracer
 import asyncio
+import itertools
+import time
+import anyio
 from mcp.shared.exceptions import McpError
-from mcp.types import AnyUrl
+from mcp.types import CONNECTION_CLOSED, AnyUrl, CallToolResult, CancelledNotification, CancelledNotificationParams, ClientNotification, EmbeddedResource, GetPromptResult, RequestParams, ReadResourceResult, ResourceUpdatedNotification, ServerCapabilities, ServerNotification
 from mcp.client.sse import sse_client
+from pydantic import ValidationError
 
 
 class MCPTransport(Enum):
@@ -17,6 +30,111 @@ class MCPTransport(Enum):
     SSE = "sse"
 
 
+# 当前这次call_function发出的、还没有收到响应的请求id
+_pending_request_ids: ContextVar[list[int] | None] = ContextVar("_pending_request_ids", default=None)
+
+
+class _TrackingClientSession(ClientSession):
+    """
+    记录call_function发出的请求id，超时或者被取消时，用来给服务端发送notifications/cancelled；
+    并且把当前span的traceparent放到请求的_meta中，服务端的span可以挂在客户端调用的span下面
+    """
+    async def send_request(self, request, *args, **kwargs):
+        params = getattr(request.root, "params", None)
+        if params is not None:
+            carrier: dict[str, str] = {}
+            get_tracer().inject(carrier)
+            if carrier:
+                meta = params.meta or RequestParams.Meta()
+                for key, value in carrier.items():
+                    setattr(meta, key, value)
+                params.meta = meta
+        request_ids = _pending_request_ids.get()
+        if request_ids is None:
+            return await super().send_request(request, *args, **kwargs)
+        # send_request在第一个await之前就会使用并递增_request_id
+        request_id = self._request_id
+        request_ids.append(request_id)
+        try:
+            result = await super().send_request(request, *args, **kwargs)
+        except asyncio.CancelledError:
+            # 保留id，由call_function发送取消通知
+            raise
+        except BaseException:
+            request_ids.remove(request_id)
+            raise
+        request_ids.remove(request_id)
+        return result
+
+
+def is_idempotent(function: MCPFunction, idempotent_tools=()) -> bool:
+    """重复执行是否安全：Resource、Prompt都是读取；Tool需要annotations声明，或者在idempotent_tools中配置"""
+    if function.type_ != MCPFunctionType.TOOL:
+        return True
+    if function.name in idempotent_tools:
+        return True
+    annotations = function.annotations
+    return annotations is not None and bool(annotations.readOnlyHint or annotations.idempotentHint)
+
+
+def response_text(response: CallToolResult | ReadResourceResult | GetPromptResult | MCPResult) -> str:
+    """结果中所有文本部分拼起来的内容，和MCPResult.from_response(response).text一致，但不用构造MCPResult"""
+    if isinstance(response, MCPResult):
+        return response.text
+    if isinstance(response, CallToolResult):
+        parts = response.content
+    elif isinstance(response, ReadResourceResult):
+        parts = response.contents
+    else:
+        parts = [message.content for message in response.messages]
+    texts = []
+    for part in parts:
+        if isinstance(part, EmbeddedResource):
+            part = part.resource
+        text = getattr(part, "text", None)
+        if text is not None:
+            texts.append(text)
+    return "\n".join(texts)
+
+
+async def iter_chunks(
+    read: Callable[[dict[str, Any]], Awaitable[MCPResult]],
+    arguments: dict[str, Any] | None,
+    chunk_size: int,
+) -> AsyncIterator[memoryview]:
+    """
+    按offset、length循环读取带分块参数的Resource Template，返回空的分块时结束。
+    同一时间只持有一个分块
+    :param read: 读取一个分块的函数，参数是包含offset和length的arguments
+    """
+    offset = 0
+    while True:
+        result = await read({**(arguments or {}), "offset": offset, "length": chunk_size})
+        if not result.contents:
+            return
+        content = result.contents[0]
+        chunk = content.data if content.is_binary else memoryview((content.text or "").encode("utf-8"))
+        # 服务端可能限制了单个分块的大小，返回的字节数比length少不代表读完了，读到空的分块才结束
+        if not chunk.nbytes:
+            return
+        yield chunk
+        offset += chunk.nbytes
+
+
+def _check_chunked(function: MCPFunction, chunk_size: int):
+    if not is_chunked(function):
+        raise ValueError(f"{function.name}不是带offset和length参数的Resource Template，不能分块读取")
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size必须大于0：{chunk_size}")
+
+
+def is_connection_error(e: BaseException) -> bool:
+    """异常是否说明和MCP Server的连接已经断开（子进程退出、SSE流断开等）"""
+    if isinstance(e, McpError):
+        return e.error.code == CONNECTION_CLOSED
+    return isinstance(e, (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream, ConnectionError))
+
+
 class MCPServer:
     """
     这个类，代表的是一个MCP Server，里面封装了和MCP Server的连接、通信等
@@ -29,7 +147,19 @@ class MCPServer:
         args: list[str] | None = None,
         env: dict[str, Any] | None = None,
         url: str | None = None,
+        resource_cache: LRUCache | None = None,
+        resource_cache_ttl: float | None = None,
+        tool_memoizer: ToolMemoizer | None = None,
+        metrics: MCPMetrics | None = None,
     ):
+        """
+        :param resource_cache: Resource/Resource Template读取结果的缓存，可以在多个Server之间共享，
+            key是(Server名字, 完整的uri)
+        :param resource_cache_ttl: 当前Server的缓存过期时间（秒），None时使用缓存的default_ttl，0表示不缓存。
+            Server支持订阅时，收到resources/updated通知会立即让对应的缓存失效
+        :param tool_memoizer: 纯函数Tool的调用结果缓存，只对其允许的Tool生效
+        :param metrics: 记录连接、握手、获取函数目录和调用的耗时、结果大小、错误数，None表示不记录
+        """
         self.name = name
         self.transport = transport
         if self.transport == MCPTransport.STDIO:
@@ -48,60 +178,133 @@ class MCPServer:
         self.session: ClientSession | None = None
         # 保存当前MCP Server的所有Function（Tool、Resource、Resource Template、 Prompt）
         self.functions: dict[str, MCPFunction] = {}
+        # 后台运行模式（start/stop）下，持有连接的任务以及通知其退出的事件
+        self._runner: asyncio.Task | None = None
+        self._stop_event: asyncio.Event | None = None
+        self._cancel_scope: anyio.CancelScope | None = None
+        self._ready: asyncio.Future | None = None
+        # 正在进行中的调用数量，以及最后一次使用的时间，用于空闲回收
+        self.inflight = 0
+        self.last_used = time.monotonic()
+        self.resource_cache = resource_cache
+        self.resource_cache_ttl = resource_cache_ttl
+        self.tool_memoizer = tool_memoizer
+        self.metrics = metrics
+        # 握手时服务端返回的能力，以及已经订阅了更新通知的uri
+        self.capabilities: ServerCapabilities | None = None
+        self._subscribed_uris: set[str] = set()
+        # 编译好的uri模板：模板字符串 -> UriTemplate
+        self._uri_templates: dict[str, UriTemplate] = {}
+        # 握手完成后才算连接好
+        self._connected = False
+        # 连接意外断开（调用时遇到连接错误或者ping失败），等待重新连接
+        self.connection_lost = False
 
     async def initialize(self):
         # 初始化操作：连接好MCP Server，以及获取Session对象，以及服务的Tool、Resource、Prompt
-        if self.transport == MCPTransport.STDIO:
-            params = StdioServerParameters(
-                command = self.cmd,
-                args = self.args,
-                env = self.env,
-            )
-            read_stream, write_stream = await self._exit_stack.enter_async_context(
-                stdio_client(params)
-            )
-            self.session = await self._exit_stack.enter_async_context(
-                ClientSession(read_stream, write_stream)
-            )
-        else:
-            read_stream, write_stream = await self._exit_stack.enter_async_context(
-                # url: http://127.0.0.1:8000/sse
-                sse_client(self.url)
-            )
-            self.session = await self._exit_stack.enter_async_context(
-                ClientSession(read_stream, write_stream)
-            )
+        with self._measure("connect"):
+            if self.transport == MCPTransport.STDIO:
+                params = StdioServerParameters(
+                    command = self.cmd,
+                    args = self.args,
+                    env = self.env,
+                )
+                read_stream, write_stream = await self._exit_stack.enter_async_context(
+                    stdio_client(params)
+                )
+                self.session = await self._exit_stack.enter_async_context(
+                    _TrackingClientSession(read_stream, write_stream, message_handler=self._handle_message)
+                )
+            else:
+                read_stream, write_stream = await self._exit_stack.enter_async_context(
+                    # url: http://127.0.0.1:8000/sse
+                    sse_client(self.url)
+                )
+                self.session = await self._exit_stack.enter_async_context(
+                    _TrackingClientSession(read_stream, write_stream, message_handler=self._handle_message)
+                )
 
         # 要初始化
-        await self.session.initialize()
+        with self._measure("handshake"):
+            self.capabilities = (await self.session.initialize()).capabilities
+        # 新的会话上还没有订阅任何uri，之前缓存的读取结果收不到更新通知了，全部丢弃
+        self._subscribed_uris = set()
+        if self.resource_cache is not None:
+            self.resource_cache.pop_where(lambda key: key[0] == self.name)
         # 获取MCP Server的所有Tool、Resource、Prompt
         await self.fetch_functions()
+        self._connected = True
+        self.connection_lost = False
 
-    async def fetch_functions(self):
-        assert self.session is not None
-        # 1. 获取tool
+    @contextmanager
+    def _measure(self, phase: str):
+        """记录连接、握手、获取函数目录这几个阶段的耗时和错误"""
+        if self.metrics is None:
+            yield
+            return
+        start = time.perf_counter()
         try:
-            tools = (await self.session.list_tools()).tools
+            yield
+        except Exception as e:
+            self.metrics.error(phase, self.name, e)
+            raise
+        self.metrics.observe(phase, self.name, time.perf_counter() - start)
+
+    async def _handle_message(self, message):
+        # 服务端推送的resources/updated通知：对应的缓存失效
+        if isinstance(message, ServerNotification) and isinstance(message.root, ResourceUpdatedNotification):
+            if self.resource_cache is not None:
+                self.resource_cache.pop((self.name, str(message.root.params.uri)))
+
+    async def _list_all(self, list_method, field: str) -> list:
+        """
+        按nextCursor分页获取某一类函数的完整列表，每一页到达后立即请求下一页。
+        服务端不支持该类功能时会抛出McpError，当作空列表处理
+        :param list_method: session.list_tools等方法
+        :param field: 结果中列表对应的字段名，比如tools、resources
+        """
+        items = []
+        cursor = None
+        try:
+            while True:
+                result = await list_method(cursor=cursor)
+                items.extend(getattr(result, field))
+                cursor = result.nextCursor
+                if not cursor:
+                    break
         except McpError:
-            tools = []
+            # 已经拿到的分页也没有意义了，保持和以前一样：出错就当作没有
+            return []
+        return items
+
+    async def fetch_functions(self):
+        assert self.session is not None
+        # 4类函数的获取互不依赖，并发请求，只需要一次往返的时间
+        with self._measure("discovery"):
+            tools, resources, resource_templates, prompts = await asyncio.gather(
+                self._list_all(self.session.list_tools, "tools"),
+                self._list_all(self.session.list_resources, "resources"),
+                self._list_all(self.session.list_resource_templates, "resourceTemplates"),
+                self._list_all(self.session.list_prompts, "prompts"),
+            )
+        # 先放到新的字典中，全部完成后再替换，避免其他任务看到一半的结果
+        functions: dict[str, MCPFunction] = {}
+        # 1. tool
         for tool in tools:
             tool_name = tool.name.replace(" ", "_")
-            self.functions[tool_name] = MCPFunction(
+            functions[tool_name] = MCPFunction(
                 name=tool_name,
                 origin_name=tool.name,
                 server_name=self.name,
                 description=tool.description,
                 type_=MCPFunctionType.TOOL,
-                input_schema=tool.inputSchema
+                input_schema=tool.inputSchema,
+                annotations=tool.annotations
             )
-        # 2. 获取resource
-        try:
-            resources = (await self.session.list_resources()).resources
-        except McpError:
-            resources = []
+        # 2. resource
         for resource in resources:
             resource_name = resource.name.replace(" ", "_")
-            self.functions[resource_name] = MCPFunction(
+            functions[resource_name] = MCPFunction(
                 name=resource_name,
                 origin_name=resource.name,
                 server_name=self.name,
@@ -110,14 +313,10 @@ class MCPServer:
                 # 如果是Resource类型，那么resource.uri是AnyUrl类型
                 uri=resource.uri
             )
-        # 3. 获取resource template
-        try:
-            resource_templates = (await self.session.list_resource_templates()).resourceTemplates
-        except McpError:
-            resource_templates = []
+        # 3. resource template
         for resource_template in resource_templates:
             resource_template_name = resource_template.name.replace(" ", "_")
-            self.functions[resource_template_name] = MCPFunction(
+            functions[resource_template_name] = MCPFunction(
                 name=resource_template_name,
                 origin_name=resource_template.name,
                 server_name=self.name,
@@ -126,17 +325,15 @@ class MCPServer:
                 # 如果是RESOURCE_TEMPLATE类型，那么uriTemplate是str类型
                 uri=resource_template.uriTemplate
             )
-        # 4. 获取prompt
-        try:
-            prompts = (await self.session.list_prompts()).prompts
-        except McpError:
-            prompts = []
+            # 加载目录时就编译好模板，不支持的模板等到调用时再报错
+            try:
+                self.uri_template(functions[resource_template_name])
+            except UriTemplateError:
+                pass
+        # 4. prompt
         for prompt in prompts:
-            # print(type(prompt.arguments))
-            # print(type(prompt.arguments[0]))
-            # print(prompt.arguments)
             prompt_name = prompt.name.replace(" ", "_")
-            self.functions[prompt_name] = MCPFunction(
+            functions[prompt_name] = MCPFunction(
                 name=prompt_name,
                 origin_name=prompt.name,
                 server_name=self.name,
@@ -144,70 +341,991 @@ class MCPServer:
                 type_=MCPFunctionType.PROMPT,
                 arguments=prompt.arguments
             )
+        self.functions = functions
+
+    async def call_function(
+        self,
+        name: str,
+        arguments: dict[str, Any] | None = None,
+        timeout: float | None = None,
+        full: bool = False,
+    ) -> str | MCPResult:
+        """
+        :param timeout: 超时时间（秒），超时会抛出TimeoutError。
+            超时或者被取消时，会给服务端发送notifications/cancelled，让服务端也停止处理
+        :param full: 返回完整的MCPResult（所有内容部分、structuredContent、二进制内容），
+            False时只返回所有文本部分拼起来的字符串
+        """
+        attributes = {"mcp.server.name": self.name, "mcp.function.name": name}
+        with get_tracer().start_span("MCPServer.call_function", attributes):
+            # 在第一个await之前增加计数，空闲回收的逻辑据此判断Server是否正在使用
+            self.inflight += 1
+            self.last_used = time.monotonic()
+            metrics = self.metrics
+            if metrics is not None:
+                metrics.call_started(self.name)
+            start = time.perf_counter()
+            request_ids: list[int] = []
+            token = _pending_request_ids.set(request_ids)
+            scope = asyncio.timeout(timeout)
+            try:
+                async with scope:
+                    response = await self._call_function(name, arguments)
+            except TimeoutError as e:
+                if metrics is not None:
+                    metrics.error("call", self.name, e, name)
+                if not scope.expired():
+                    raise
+                await self._cancel_requests(request_ids, "timeout")
+                raise TimeoutError(f"MCP Server {self.name} 调用{name}超时（{timeout:.3g}秒）") from None
+            except asyncio.CancelledError:
+                # 外层（比如MCPServerManager）的超时也是通过取消实现的
+                if metrics is not None:
+                    metrics.error("call", self.name, "CancelledError", name)
+                await self._cancel_requests(request_ids, "cancelled by client")
+                raise
+            except Exception as e:
+                if metrics is not None:
+                    metrics.error("call", self.name, e, name)
+                if is_connection_error(e):
+                    self._mark_connection_lost()
+                raise
+            finally:
+                _pending_request_ids.reset(token)
+                self.inflight -= 1
+                self.last_used = time.monotonic()
+                if metrics is not None:
+                    metrics.call_finished(self.name)
+                    metrics.observe("call", self.name, time.perf_counter() - start, name)
+            result = MCPResult.from_response(response) if full else response_text(response)
+            if metrics is not None:
+                metrics.observe_payload(self.name, name, len(result) if isinstance(result, str) else result.size)
+            return result
 
-    async def call_function(self, name: str, arguments: dict[str, Any] | None = None):
+    def read_chunks(
+        self, name: str, arguments: dict[str, Any] | None = None, chunk_size: int = 64 * 1024
+    ) -> AsyncIterator[memoryview]:
+        """
+        分块读取很大的Resource，内存占用只和chunk_size有关，和资源的大小无关。
+        name必须是带offset和length参数的Resource Template，比如file://data/{grade}.json/chunk/{offset}/{length}
+        :param arguments: offset、length以外的参数
+        :param chunk_size: 每次请求的字节数，服务端可能限制单个分块的大小，返回的分块会更小
+        """
+        _check_chunked(self.functions[name], chunk_size)
+        return iter_chunks(lambda chunk_arguments: self.call_function(name, chunk_arguments, full=True), arguments, chunk_size)
+
+    async def _cancel_requests(self, request_ids: list[int], reason: str):
+        if not request_ids or self.session is None:
+            return
+        for request_id in request_ids:
+            try:
+                await self.session.send_notification(ClientNotification(CancelledNotification(
+                    params=CancelledNotificationParams(requestId=request_id, reason=reason)
+                )))
+            except Exception:
+                # 连接已经断开，服务端也就不会继续处理了
+                pass
+
+    def _mark_connection_lost(self):
+        self._connected = False
+        self.connection_lost = True
+
+    async def ping(self, timeout: float = 5) -> bool:
+        """用MCP的ping检查连接是否正常，失败时标记为连接断开"""
+        if not self.connected:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout)
+            return True
+        except Exception:
+            self._mark_connection_lost()
+            return False
+
+    async def _call_function(
+        self, name: str, arguments: dict[str, Any] | None = None
+    ) -> CallToolResult | ReadResourceResult | GetPromptResult | MCPResult:
+        """返回MCP原始的结果，由call_function转换成文本或者MCPResult"""
         function = self.functions[name]
         if function.type_ == MCPFunctionType.TOOL:
-            response = await self.session.call_tool(name=function.origin_name, arguments=arguments)
-            return response.content[0].text
+            return await self._call_tool(function, arguments)
         elif function.type_ == MCPFunctionType.RESOURCE:
-            response = await self.session.read_resource(function.uri)
-            return response.contents[0].text
+            return await self._read_resource(function.uri)
         elif function.type_ == MCPFunctionType.RESOURCE_TEMPLATE:
             # resource_template类型：需要将参数格式化到uri中
-            # uri：file://{filename}.format(filename=xxx)
-            uri = AnyUrl(function.uri.format(**arguments))
-            response = await self.session.read_resource(uri)
-            return response.contents[0].text
+            # uri：file://{filename} + {"filename": xxx} -> file://xxx，参数名不对时直接抛出UriTemplateError
+            uri = self.uri_template(function).expand(arguments)
+            try:
+                uri = AnyUrl(uri)
+            except ValidationError as e:
+                raise UriTemplateError(f"参数格式化出的uri不合法：{uri}") from e
+            # 分块读取的结果只用一次，放进缓存只会挤掉常用的条目
+            return await self._read_resource(uri, cache=not is_chunked(function))
         else:
-            response = await self.session.get_prompt(name=function.origin_name, arguments=arguments)
-            return response.content.text
+            return await self.session.get_prompt(name=function.origin_name, arguments=arguments)
+
+    def uri_template(self, function: MCPFunction) -> UriTemplate:
+        """Resource Template编译好的uri模板，按模板字符串缓存，目录更新后也不用重新编译没有变的模板"""
+        template = self._uri_templates.get(function.uri)
+        if template is None:
+            template = self._uri_templates[function.uri] = UriTemplate(function.uri)
+        return template
+
+    async def _call_tool(self, function: MCPFunction, arguments: dict[str, Any] | None) -> CallToolResult:
+        memoizer = self.tool_memoizer
+        if memoizer is None or not memoizer.enabled_for(function):
+            return await self.session.call_tool(name=function.origin_name, arguments=arguments)
+        key = memoizer.make_key(self.name, function, arguments)
+        response = memoizer.get(key)
+        if response is None:
+            response = await self.session.call_tool(name=function.origin_name, arguments=arguments)
+            memoizer.set(key, response)
+        return response
+
+    async def _read_resource(self, uri: AnyUrl | str, cache: bool = True) -> ReadResourceResult:
+        if not cache or self.resource_cache is None or self.resource_cache_ttl == 0:
+            return await self.session.read_resource(uri)
+        key = (self.name, str(uri))
+        response = self.resource_cache.get(key)
+        if response is not None:
+            return response
+        # 先订阅再读取，读取之后发生的修改一定能收到通知
+        await self._subscribe(uri)
+        response = await self.session.read_resource(uri)
+        self.resource_cache.set(key, response, size=resource_size(response), ttl=self.resource_cache_ttl)
+        return response
+
+    async def _subscribe(self, uri: AnyUrl | str):
+        resources = self.capabilities.resources if self.capabilities else None
+        if not resources or not resources.subscribe or str(uri) in self._subscribed_uris:
+            return
+        self._subscribed_uris.add(str(uri))
+        try:
+            await self.session.subscribe_resource(AnyUrl(str(uri)))
+        except McpError:
+            pass
 
     async def aclose(self):
+        self._connected = False
         await self._exit_stack.aclose()
+        self.session = None
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    async def start(self, timeout: float | None = None):
+        """
+        在一个独立的后台任务中连接MCP Server，并一直持有连接，直到调用stop()。
+        stdio_client/sse_client内部使用了anyio的cancel scope，必须在同一个任务里进入和退出，
+        所以需要并发连接多个Server时，用这个方法代替initialize/aclose。
+        :param timeout: 连接（包括握手和获取函数）的超时时间，超时会抛出TimeoutError
+        """
+        if self._runner is not None:
+            if self.connected:
+                return
+            # 之前的连接已经断开，先回收掉后台任务再重新连接。
+            # 同一个Server的start不能并发调用，由调用方保证（比如MCPServerManager的连接锁）
+            await self.stop()
+        self._ready = ready = asyncio.get_running_loop().create_future()
+        self._stop_event = asyncio.Event()
+        self._runner = asyncio.create_task(self._run(ready), name=f"mcp-server-{self.name}")
+        try:
+            # shield：超时只取消等待，由stop()负责取消后台任务
+            await asyncio.wait_for(asyncio.shield(ready), timeout)
+        except BaseException:
+            await self.stop()
+            if ready.done() and not ready.cancelled():
+                # 标记异常已被读取，避免asyncio打印"never retrieved"的警告
+                ready.exception()
+            raise
+
+    async def _run(self, ready: asyncio.Future):
+        try:
+            # 用anyio的cancel scope来取消连接过程：直接cancel asyncio任务时，
+            # stdio_client的清理逻辑会一直等到子进程自己退出
+            with anyio.CancelScope() as self._cancel_scope:
+                async with self:
+                    ready.set_result(None)
+                    await self._stop_event.wait()
+            if not ready.done():
+                ready.set_exception(TimeoutError(f"MCP Server {self.name} 的连接被取消"))
+        except BaseException as e:
+            if not ready.done():
+                ready.set_exception(e)
+                # 异常已经交给了start()的调用者，这里不需要再抛出
+                return
+            raise
+        finally:
+            self._connected = False
+            self.session = None
+
+    async def stop(self):
+        runner, self._runner = self._runner, None
+        if runner is None:
+            return
+        self._stop_event.set()
+        if not self._ready.done() and self._cancel_scope is not None:
+            # 还在连接中，直接取消
+            self._cancel_scope.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
 
     async def __aenter__(self):
-        # 初始化
-        await self.initialize()
+        # 初始化，失败时要把已经建立的连接（子进程、SSE流）清理掉
+        try:
+            await self.initialize()
+        except BaseException:
+            await self.aclose()
+            raise
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         await self.aclose()
 
 
+class MCPServerPool(MCPServer):
+    """
+    连接池版本的MCP Server：同一个MCP Server维护多个连接（多个stdio子进程或多个SSE连接），
+    并发的调用分发到不同的连接上，一个慢调用不会阻塞其他调用。
+    在mcp_dicts中通过pool字段配置，例如：
+    "pool": {"min_size": 1, "max_size": 4, "strategy": "least_busy", "health_check_interval": 30}
+    """
+    def __init__(
+        self,
+        name: str,
+        min_size: int = 1,
+        max_size: int = 4,
+        strategy: str = "least_busy",
+        health_check_interval: float = 30,
+        health_check_timeout: float = 5,
+        hedge: bool = False,
+        hedge_percentile: float = 0.95,
+        hedge_min_samples: int = 20,
+        hedge_min_delay: float = 0.005,
+        hedge_budget: float = 0.1,
+        idempotent_tools=(),
+        **kwargs,
+    ):
+        """
+        :param min_size: 最少保持的连接数
+        :param max_size: 最多的连接数，所有连接都忙时会自动扩容，直到max_size
+        :param strategy: 分发策略，least_busy（进行中调用最少的连接）或round_robin（轮询）
+        :param health_check_interval: 健康检查（ping）的间隔，断开或ping失败的连接会被替换
+        :param health_check_timeout: ping的超时时间
+        :param hedge: 是否对幂等的读取发送对冲请求：调用超过这个函数最近耗时的hedge_percentile分位数还没返回，
+            就在另一个空闲的连接上再发一次，谁先成功用谁的结果，另一个被取消。没有空闲的连接时不对冲，避免加重已经饱和的Server的负担
+        :param hedge_percentile: 对冲的延迟取最近耗时的哪个分位数
+        :param hedge_min_samples: 这个函数的耗时样本少于多少个时不对冲
+        :param hedge_min_delay: 对冲的最短延迟（秒）
+        :param hedge_budget: 对冲请求数最多占可对冲调用数的比例
+        :param idempotent_tools: 可以安全重复执行的Tool，和MCPServerManager的idempotent_tools配置一致
+        :param kwargs: 其余参数和MCPServer一致，池中的每个连接都用这些参数创建
+        """
+        super().__init__(name, **kwargs)
+        # 调用由池中的连接记录，池本身不重复记录
+        self.metrics = None
+        assert 1 <= min_size <= max_size
+        assert strategy in ("least_busy", "round_robin")
+        self._member_kwargs = kwargs
+        self.min_size = min_size
+        self.max_size = max_size
+        self.strategy = strategy
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        # 池中的连接，每个连接都是一个普通的MCPServer
+        self.members: list[MCPServer] = []
+        self._round_robin = itertools.count()
+        # 扩容、健康检查等后台任务
+        self._tasks: set[asyncio.Task] = set()
+        self._growing = False
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_budget = hedge_budget
+        self.idempotent_tools = idempotent_tools
+        # 函数名 -> 最近的调用耗时
+        self._latencies: dict[str, LatencyWindow] = {}
+        # 已经创建、还没开始运行的调用任务数，这些调用还没有计入连接的inflight
+        self._starting: dict[MCPServer, int] = {}
+        # 可对冲的调用数（样本足够的幂等调用）、发出的对冲请求数，以及对冲请求先返回的次数
+        self.hedge_candidates = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    @property
+    def connected(self) -> bool:
+        return any(member.connected for member in self.members)
+
+    def _mark_connection_lost(self):
+        # 单个连接断开由健康检查替换，所有连接都断开了才算整个池断开
+        if not self.connected:
+            self.connection_lost = True
+
+    async def ping(self, timeout: float = 5) -> bool:
+        # 池中的连接由自己的健康检查负责
+        return self.connected
+
+    async def initialize(self):
+        members = [MCPServer(self.name, **self._member_kwargs) for _ in range(self.min_size)]
+        # 先放进members，启动到一半被取消时，aclose也能清理掉
+        self.members = members
+        results = await asyncio.gather(*(member.start() for member in members), return_exceptions=True)
+        self.members = [member for member, result in zip(members, results) if result is None]
+        if not self.members:
+            raise results[0]
+        self.functions = self.members[0].functions
+        self._spawn(self._health_check_loop())
+
+    async def fetch_functions(self):
+        member = self._pick_member()
+        await member.fetch_functions()
+        self.functions = member.functions
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _pick_member(self, exclude: MCPServer | None = None) -> MCPServer:
+        alive = [member for member in self.members if member.connected]
+        if exclude is not None and exclude in alive and len(alive) > 1:
+            alive.remove(exclude)
+        if not alive:
+            raise ConnectionError(f"MCP Server {self.name} 没有可用的连接")
+        if self.strategy == "round_robin":
+            member = alive[next(self._round_robin) % len(alive)]
+        else:
+            member = min(alive, key=self._load)
+        # 选中的连接已经在忙，说明所有连接都在忙，后台扩容，不阻塞当前调用
+        if self._load(member) and len(self.members) < self.max_size and not self._growing:
+            self._growing = True
+            self._spawn(self._grow())
+        return member
+
+    def _idle_member(self, exclude: MCPServer) -> MCPServer | None:
+        """除了exclude之外没有进行中调用的连接，没有时返回None"""
+        for member in self.members:
+            if member is not exclude and member.connected and not self._load(member):
+                return member
+        return None
+
+    def _load(self, member: MCPServer) -> int:
+        return member.inflight + self._starting.get(member, 0)
+
+    async def _grow(self):
+        try:
+            await self._add_member()
+        except Exception as e:
+            print(f"MCP Server {self.name} 扩容失败：{e!r}")
+        finally:
+            self._growing = False
+
+    async def _add_member(self):
+        member = MCPServer(self.name, **self._member_kwargs)
+        await member.start()
+        self.members.append(member)
+
+    async def _remove_member(self, member: MCPServer):
+        self.members.remove(member)
+        await member.stop()
+
+    async def _call_function(self, name: str, arguments: dict[str, Any] | None = None):
+        # 超时由外层的call_function控制，取消会传递到连接上，由连接发送notifications/cancelled
+        function = self.functions.get(name)
+        if not self.hedge or function is None or not is_idempotent(function, self.idempotent_tools):
+            return await self._timed_call(self._pick_member(), name, arguments)
+        return await self._hedged_call(name, arguments)
+
+    async def _timed_call(self, member: MCPServer, name: str, arguments: dict[str, Any] | None):
+        start = time.monotonic()
+        result = await member.call_function(name, arguments, full=True)
+        self._latencies.setdefault(name, LatencyWindow()).add(time.monotonic() - start)
+        return result
+
+    def _start_call(self, member: MCPServer, name: str, arguments: dict[str, Any] | None) -> asyncio.Task:
+        """
+        在后台任务中调用。任务开始运行之前就计入这个连接的负载，
+        同一时间并发进来的其他调用选择连接时能看到它
+        """
+        self._starting[member] = self._starting.get(member, 0) + 1
+        released = False
+
+        def release(_=None):
+            nonlocal released
+            if not released:
+                released = True
+                self._starting[member] -= 1
+
+        async def call():
+            # 紧接着member.call_function会在第一个await之前增加inflight
+            release()
+            return await self._timed_call(member, name, arguments)
+
+        task = asyncio.create_task(call())
+        # 任务在开始运行之前就被取消时，也要还回去
+        task.add_done_callback(release)
+        return task
+
+    async def _hedged_call(self, name: str, arguments: dict[str, Any] | None):
+        latencies = self._latencies.get(name)
+        first = self._pick_member()
+        if latencies is None or len(latencies) < self.hedge_min_samples:
+            return await self._timed_call(first, name, arguments)
+        self.hedge_candidates += 1
+        delay = max(self.hedge_min_delay, latencies.percentile(self.hedge_percentile))
+        primary = self._start_call(first, name, arguments)
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            # 第一个请求比平时慢，对冲的预算还有剩余时，在另一个空闲的连接上再发一次
+            second = None
+            if not done and self.hedged < self.hedge_budget * self.hedge_candidates:
+                second = self._idle_member(exclude=first)
+            if second is not None:
+                self.hedged += 1
+                tasks.add(self._start_call(second, name, arguments))
+            error = None
+            pending = tasks
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    # 输掉的请求被取消，连接会给服务端发送notifications/cancelled
+                    task.cancel()
+                    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _health_check_loop(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            try:
+                await self._check_members()
+            except Exception as e:
+                print(f"MCP Server {self.name} 健康检查失败：{e!r}")
+
+    async def _check_members(self):
+        # 1. 替换掉断开或者ping不通的连接
+        for member in list(self.members):
+            if not await member.ping(self.health_check_timeout):
+                await self._remove_member(member)
+        # 2. 缩容：超过min_size的部分，空闲的连接关掉
+        now = time.monotonic()
+        for member in list(self.members):
+            if len(self.members) <= self.min_size:
+                break
+            if not member.inflight and now - member.last_used >= self.health_check_interval:
+                await self._remove_member(member)
+        # 3. 补足到min_size
+        missing = self.min_size - len(self.members)
+        if missing > 0:
+            await asyncio.gather(*(self._add_member() for _ in range(missing)), return_exceptions=True)
+
+    async def aclose(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        members, self.members = self.members, []
+        await asyncio.gather(*(member.stop() for member in members), return_exceptions=True)
+        self.session = None
+
+
 class MCPServerManager:
-    def __init__(self, mcp_dicts: dict):
+    def __init__(
+        self,
+        mcp_dicts: dict,
+        concurrent: bool = False,
+        max_concurrency: int = 8,
+        startup_timeout: float | None = 30,
+        catalog_cache: CatalogCache | None = None,
+        lazy: bool = False,
+        idle_timeout: float | None = None,
+        resource_cache: LRUCache | None = None,
+        single_flight: bool = True,
+        minify_tool_schemas: bool = False,
+        health_check_interval: float | None = None,
+        health_check_timeout: float = 5,
+        reconnect_max_backoff: float = 30,
+        default_timeout: float | None = None,
+        server_limits: dict[str, Any] | None = None,
+        circuit_breaker: dict[str, Any] | None = None,
+        metrics: MCPMetrics | None = None,
+    ):
+        """
+        :param mcp_dicts: MCP Server的配置，格式和Claude Desktop的mcpServers一致
+        :param concurrent: 是否并发启动所有的MCP Server。并发模式下，启动失败或超时的Server会被跳过，
+            记录在failed_servers中，不会影响其他Server
+        :param max_concurrency: 并发模式下，同时启动的Server的最大数量
+        :param startup_timeout: 并发模式下，单个Server的启动超时时间（秒），None表示不超时
+        :param catalog_cache: 函数目录的磁盘缓存。命中缓存的Server直接用缓存的函数目录，
+            在后台连接并校验，目录有变化时再替换all_functions；没有命中的Server按并发模式启动
+        :param lazy: 懒加载模式。函数目录来自catalog_cache（没有指定时使用默认目录），
+            命中缓存的Server在第一次call_function时才连接（启动子进程）
+        :param idle_timeout: 懒加载模式下，Server空闲多少秒后断开连接，None表示不断开
+        :param resource_cache: 所有Server共享的Resource读取结果缓存，
+            每个Server的过期时间可以在mcp_dicts中用resource_cache_ttl配置
+        :param single_flight: 是否合并相同的并发调用（同一个函数、规范化后相同的参数），
+            合并的调用共享同一个请求的结果或异常。只合并幂等的函数（Resource、Prompt，以及annotations声明了
+            只读或幂等、或者在mcp_dicts的idempotent_tools中配置的Tool），幂等的函数也可以用single_flight_exclude排除
+        :param minify_tool_schemas: tool_schemas是否精简schema（去掉title、压缩description中的空白）
+        :param health_check_interval: 健康检查的间隔（秒），None表示不检查。每个Server定期ping，
+            ping失败或者调用时发现连接断开，会按指数退避重新连接，并重新获取函数目录
+        :param health_check_timeout: ping的超时时间
+        :param reconnect_max_backoff: 重新连接失败后，两次重试之间的最长等待时间
+        :param default_timeout: call_function默认的超时时间（秒），None表示不超时。
+            每个Server可以在mcp_dicts中用timeout覆盖，单个函数可以用timeouts（函数名 -> 秒数）覆盖
+        :param server_limits: 每个Server默认的准入控制配置，mcp_dicts中配置了limits的Server使用自己的配置。
+            比如{"max_concurrency": 4, "max_queue": 16, "queue_timeout": 5, "rate": 10, "burst": 20}，
+            参数的含义见AdmissionController。排队的调用超过max_queue、排队超时或者限流需要等待太久时，
+            调用会立即抛出OverloadedError
+        :param circuit_breaker: 每个Server默认的熔断器配置，mcp_dicts中配置了circuit_breaker的Server使用自己的配置。
+            比如{"failure_threshold": 0.5, "latency_threshold": 5, "open_duration": 30}，参数的含义见CircuitBreaker。
+            熔断期间的调用会立即抛出CircuitOpenError
+        :param metrics: 所有Server共用的统计（各阶段耗时的直方图、结果大小、错误数、进行中的调用数），
+            可以用metrics.snapshot()或者metrics.render_prometheus()导出，None表示不记录
+        """
         self.mcp_dicts = mcp_dicts
+        self.concurrent = concurrent
+        self.max_concurrency = max_concurrency
+        self.startup_timeout = startup_timeout
+        self.catalog_cache = catalog_cache
+        self.lazy = lazy
+        self.idle_timeout = idle_timeout
+        self.resource_cache = resource_cache
+        self.single_flight = SingleFlight() if single_flight else None
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self.reconnect_max_backoff = reconnect_max_backoff
+        self.default_timeout = default_timeout
+        self.metrics = metrics
+        # 每个Server的准入控制：并发上限、等待队列、限流
+        self.admission: dict[str, AdmissionController] = {}
+        for name, mcp_dict in mcp_dicts.items():
+            limits = mcp_dict.get('limits', server_limits)
+            if limits:
+                self.admission[name] = AdmissionController.from_config(name, limits)
+        # 每个Server的熔断器
+        self.breakers: dict[str, CircuitBreaker] = {}
+        for name, mcp_dict in mcp_dicts.items():
+            config = mcp_dict.get('circuit_breaker', circuit_breaker)
+            if config:
+                self.breakers[name] = CircuitBreaker.from_config(name, config)
+        # 根据all_functions生成的Function Calling格式的tools，目录不变时直接使用缓存
+        self.tool_schemas = ToolSchemaCatalog(lambda: self.all_functions, minify=minify_tool_schemas)
+        # uri -> Resource/Resource Template的反向路由，all_functions替换后重新构建
+        self._uri_router: UriTemplateRouter[str] = UriTemplateRouter()
+        self._uri_router_source: dict[str, MCPFunction] | None = None
+        if self.lazy and self.catalog_cache is None:
+            self.catalog_cache = CatalogCache()
         self.servers: dict[str,MCPServer] = {}
         self._exit_stack: AsyncExitStack = AsyncExitStack()
         self.all_functions: dict[str, MCPFunction] = {}
+        # 启动失败的Server：名字 -> 异常
+        self.failed_servers: dict[str, BaseException] = {}
+        # 每个Server一把锁，保证同一时间只有一个任务在连接它
+        self._connect_locks: dict[str, asyncio.Lock] = {}
+        # 后台任务：校验函数目录、回收空闲的Server
+        self._background_tasks: set[asyncio.Task] = set()
+
+    def _create_server(self, name: str, mcp_dict: dict) -> MCPServer:
+        transport = MCPTransport.STDIO
+        if not mcp_dict.get('command'):
+            transport = MCPTransport.SSE
+        kwargs = dict(
+            name=name,
+            transport=transport,
+            cmd=mcp_dict.get('command'),
+            args=mcp_dict.get('args'),
+            env=mcp_dict.get('env'),
+            url=mcp_dict.get('url'),
+            resource_cache=self.resource_cache,
+            resource_cache_ttl=mcp_dict.get('resource_cache_ttl'),
+            # 配置了memoize字段的Server，缓存允许的纯函数Tool的调用结果
+            tool_memoizer=ToolMemoizer.from_config(mcp_dict['memoize']) if mcp_dict.get('memoize') else None,
+            metrics=self.metrics,
+        )
+        # 配置了pool字段的Server使用连接池
+        if mcp_dict.get('pool'):
+            return MCPServerPool(**kwargs, idempotent_tools=mcp_dict.get('idempotent_tools', ()), **mcp_dict['pool'])
+        return MCPServer(**kwargs)
 
     async def initialize(self):
+        if self.catalog_cache is not None:
+            await self._initialize_from_cache()
+            if self.lazy and self.idle_timeout is not None:
+                self._add_background_task(self._reap_idle_servers())
+        elif self.concurrent:
+            await self._start_servers(self.mcp_dicts)
+            self._rebuild_all_functions()
+        else:
+            for name, mcp_dict in self.mcp_dicts.items():
+                # 1. 创建好所有的MCP Server对象，在后台任务中持有连接，断开后可以重新连接
+                server = self._create_server(name, mcp_dict)
+                await server.start()
+                self.servers[name] = server
+                self._exit_stack.push_async_callback(server.stop)
+                # 2. 获取所有MCP Server的函数并且保存起来，也是存储成字典形式
+                self.all_functions.update(server.functions)
+        if self.health_check_interval is not None:
+            for name in self.servers:
+                self._add_background_task(self._supervise(name))
+
+    async def _start_servers(self, mcp_dicts: dict):
+        """并发启动mcp_dicts中的Server，返回启动成功的Server的名字"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        started = []
+
+        async def start_server(name: str, mcp_dict: dict):
+            server = self._create_server(name, mcp_dict)
+            async with semaphore:
+                try:
+                    await server.start(timeout=self.startup_timeout)
+                except Exception as e:
+                    self.failed_servers[name] = e
+                    print(f"MCP Server {name} 启动失败，已跳过：{e!r}")
+                    return
+            self.servers[name] = server
+            self._exit_stack.push_async_callback(server.stop)
+            started.append(name)
+
+        await asyncio.gather(*(
+            start_server(name, mcp_dict) for name, mcp_dict in mcp_dicts.items()
+        ))
+        return started
+
+    async def _initialize_from_cache(self):
+        missing = {}
         for name, mcp_dict in self.mcp_dicts.items():
-            # 1. 创建好所有的MCP Server对象
-            transport = MCPTransport.STDIO
-            if not mcp_dict.get('command'):
-                transport = MCPTransport.SSE
-            server = await self._exit_stack.enter_async_context(
-                MCPServer(
-                    name=name,
-                    transport=transport,
-                    cmd=mcp_dict.get('command'),
-                    args=mcp_dict.get('args'),
-                    env=mcp_dict.get('env'),
-                    url=mcp_dict.get('url')
-                )
-            )
+            functions = self.catalog_cache.load(name, mcp_dict)
+            if functions is None:
+                missing[name] = mcp_dict
+                continue
+            # 命中缓存：先用缓存的函数目录，连接和校验放到后台
+            server = self._create_server(name, mcp_dict)
+            server.functions = functions
             self.servers[name] = server
-            # 2. 获取所有MCP Server的函数并且保存起来，也是存储成字典形式
-            self.all_functions.update(server.functions)
+            self._exit_stack.push_async_callback(server.stop)
+            if not self.lazy:
+                self._add_background_task(self._refresh_catalog(name))
+
+        # 没有缓存的Server只能现场获取函数目录
+        for name in await self._start_servers(missing):
+            self.catalog_cache.save(name, missing[name], self.servers[name].functions)
+        self._rebuild_all_functions()
+
+    def _add_background_task(self, coro):
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _reap_idle_servers(self):
+        """定期断开空闲超过idle_timeout的Server，下次调用时会重新连接"""
+        interval = min(self.idle_timeout / 2, 30)
+        while True:
+            await asyncio.sleep(interval)
+            for name, server in list(self.servers.items()):
+                if not server.connected or server.inflight:
+                    continue
+                if time.monotonic() - server.last_used < self.idle_timeout:
+                    continue
+                async with self._connect_locks.setdefault(name, asyncio.Lock()):
+                    # 等锁期间可能又有了新的调用，需要再检查一次
+                    if (server.connected and not server.inflight
+                            and time.monotonic() - server.last_used >= self.idle_timeout):
+                        await server.stop()
+
+    async def _supervise(self, name: str):
+        """定期检查Server的连接，断开后按指数退避重新连接"""
+        server = self.servers[name]
+        delay = 0
+        while True:
+            await asyncio.sleep(delay or self.health_check_interval)
+            if server.connected:
+                await server.ping(self.health_check_timeout)
+            # 懒加载模式下被回收的Server不算断开，不需要重新连接
+            if not server.connection_lost:
+                delay = 0
+                continue
+            try:
+                await self._ensure_server(name)
+                print(f"MCP Server {name} 已重新连接")
+                delay = 0
+            except Exception as e:
+                delay = min(max(delay * 2, 1), self.reconnect_max_backoff)
+                print(f"MCP Server {name} 重新连接失败，{delay}秒后重试：{e!r}")
+
+    async def _refresh_catalog(self, name: str):
+        """后台连接Server，连接时会用最新的函数目录校验缓存"""
+        try:
+            await self._ensure_server(name)
+        except Exception as e:
+            # 连接失败时继续使用缓存的目录，调用时会再次尝试连接
+            self.failed_servers[name] = e
+            print(f"MCP Server {name} 连接失败：{e!r}")
+
+    def _rebuild_all_functions(self):
+        # 按配置的顺序合并函数，保证同名函数的覆盖顺序和串行启动时一致。
+        # 先构建新的字典再整体替换，读取all_functions的任务不会看到一半的结果
+        all_functions = {}
+        for name in self.mcp_dicts:
+            if name in self.servers:
+                all_functions.update(self.servers[name].functions)
+        self.all_functions = all_functions
 
-    async def call_function(self, name: str, arguments: dict[str, Any]|None=None):
+    async def _ensure_server(self, name: str) -> MCPServer:
+        """返回已经连接好的Server，还没有连接的话就先连接"""
+        server = self.servers[name]
+        if server.connected:
+            return server
+        lock = self._connect_locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            if not server.connected:
+                cached = dump_functions(server.functions)
+                await server.start(timeout=self.startup_timeout)
+                self.failed_servers.pop(name, None)
+                # 连接时重新获取了函数目录，和之前的不一样就更新缓存和all_functions
+                if dump_functions(server.functions) != cached:
+                    if self.catalog_cache is not None:
+                        self.catalog_cache.save(name, self.mcp_dicts[name], server.functions)
+                    self._rebuild_all_functions()
+        return server
+
+    async def call_function(
+        self,
+        name: str,
+        arguments: dict[str, Any]|None=None,
+        timeout: float | None = None,
+        deadline: Deadline | None = None,
+        full: bool = False,
+    ) -> str | MCPResult:
+        """
+        :param timeout: 这次调用的超时时间（秒），None表示使用mcp_dicts中配置的timeouts、timeout或者default_timeout。
+            超时会抛出TimeoutError，并给MCP Server发送notifications/cancelled
+        :param deadline: 整个流程的截止时间，超时时间不会超过剩余的时间
+        :param full: 返回完整的MCPResult，False时只返回所有文本部分拼起来的字符串
+        """
         function = self.all_functions[name]
-        server = self.servers[function.server_name]
-        return await server.call_function(name, arguments=arguments)
+        timeout = self._timeout_for(function, timeout)
+        if deadline is not None:
+            timeout = deadline.cap(timeout)
+            if timeout <= 0:
+                raise TimeoutError(f"已经超过截止时间，没有调用{name}")
+        attributes = {"mcp.server.name": function.server_name, "mcp.function.name": name}
+        with get_tracer().start_span("MCPServerManager.call_function", attributes):
+            breaker = self.breakers.get(function.server_name)
+            if breaker is not None:
+                # 已经熔断时不排队，直接失败
+                breaker.check()
+            result = await self._call_with_timeout(function, arguments, timeout)
+        return result if full else result.text
+
+    async def _call_with_timeout(
+        self, function: MCPFunction, arguments: dict[str, Any] | None, timeout: float | None
+    ) -> MCPResult:
+        scope = asyncio.timeout(timeout)
+        try:
+            async with scope:
+                if self.single_flight is None or not self._can_coalesce(function):
+                    return await self._call_function(function, arguments, scope)
+                key = (function.server_name, function.name, canonical_arguments(arguments))
+                return await self.single_flight.do(key, lambda: self._call_function(function, arguments, scope))
+        except TimeoutError:
+            if not scope.expired():
+                raise
+            raise TimeoutError(f"调用{function.name}超时（{timeout:.3g}秒）") from None
+
+    def _timeout_for(self, function: MCPFunction, timeout: float | None) -> float | None:
+        if timeout is not None:
+            return timeout
+        mcp_dict = self.mcp_dicts[function.server_name]
+        timeouts = mcp_dict.get('timeouts') or {}
+        if function.name in timeouts:
+            return timeouts[function.name]
+        return mcp_dict.get('timeout', self.default_timeout)
+
+    def _can_coalesce(self, function: MCPFunction) -> bool:
+        if function.name in self.mcp_dicts[function.server_name].get('single_flight_exclude', ()):
+            return False
+        # 分块读取的每个分块都只读一次，不需要合并
+        if is_chunked(function):
+            return False
+        # 没有声明annotations的Tool不一定能安全地合并，和重试一样只合并幂等的函数
+        return self._is_idempotent(function)
+
+    def _is_idempotent(self, function: MCPFunction) -> bool:
+        return is_idempotent(function, self.mcp_dicts[function.server_name].get('idempotent_tools', ()))
+
+    async def _call_function(
+        self, function: MCPFunction, arguments: dict[str, Any] | None, scope: asyncio.Timeout | None = None
+    ):
+        admission = self.admission.get(function.server_name)
+        if admission is None:
+            return await self._guarded_call(function, arguments, scope)
+        # 合并的调用只占用一个名额，重试也在同一个名额内进行
+        async with admission.slot():
+            return await self._guarded_call(function, arguments, scope)
+
+    async def _guarded_call(
+        self, function: MCPFunction, arguments: dict[str, Any] | None, scope: asyncio.Timeout | None
+    ) -> MCPResult:
+        breaker = self.breakers.get(function.server_name)
+        if breaker is None:
+            return await self._call_server(function, arguments)
+        # 熔断器只统计真正调用Server的耗时和结果，不包括合并等待、排队的时间，本地的背压不会触发熔断；
+        # 调用超时（scope到期）算作失败
+        async with breaker.guard(timed_out=scope.expired if scope is not None else None):
+            return await self._call_server(function, arguments)
+
+    async def _call_server(self, function: MCPFunction, arguments: dict[str, Any] | None) -> MCPResult:
+        # 内部都取完整的结果，合并的调用中有的要文本、有的要完整结果时也能共享
+        server = await self._ensure_server(function.server_name)
+        try:
+            return await server.call_function(function.name, arguments=arguments, full=True)
+        except Exception as e:
+            if not is_connection_error(e) or not self._is_idempotent(function):
+                raise
+        # 连接断开了：幂等的调用重新连接后透明地重试一次
+        server = await self._ensure_server(function.server_name)
+        return await server.call_function(function.name, arguments=arguments, full=True)
+
+    def read_chunks(
+        self, name: str, arguments: dict[str, Any] | None = None, chunk_size: int = 64 * 1024, **kwargs
+    ) -> AsyncIterator[memoryview]:
+        """
+        分块读取很大的Resource，见MCPServer.read_chunks。每个分块都是一次call_function，
+        超时、准入控制、熔断都对单个分块生效
+        :param kwargs: 传给call_function的其他参数，比如timeout
+        """
+        _check_chunked(self.all_functions[name], chunk_size)
+        return iter_chunks(
+            lambda chunk_arguments: self.call_function(name, chunk_arguments, full=True, **kwargs),
+            arguments, chunk_size,
+        )
+
+    def admission_stats(self) -> dict[str, dict[str, Any]]:
+        """配置了准入控制的Server的排队情况：Server名 -> 正在进行的调用数、排队数、拒绝数、平均和最长等待时间"""
+        return {name: admission.stats() for name, admission in self.admission.items()}
+
+    def breaker_stats(self) -> dict[str, dict[str, Any]]:
+        """配置了熔断器的Server的状态：Server名 -> 状态、失败率、延迟分位数、拒绝数"""
+        return {name: breaker.stats() for name, breaker in self.breakers.items()}
+
+    def resolve_uri(self, uri: str | AnyUrl) -> tuple[MCPFunction, dict[str, str]] | None:
+        """
+        把具体的资源uri解析回对应的Resource/Resource Template函数以及参数，没有匹配时返回None
+        """
+        if self._uri_router_source is not self.all_functions:
+            router: UriTemplateRouter[str] = UriTemplateRouter()
+            for function in self.all_functions.values():
+                if function.type_ not in (MCPFunctionType.RESOURCE, MCPFunctionType.RESOURCE_TEMPLATE):
+                    continue
+                try:
+                    # Resource的uri没有变量，当作只有字面量的模板
+                    router.add(function.name, UriTemplate(str(function.uri)))
+                except UriTemplateError:
+                    continue
+            self._uri_router = router
+            self._uri_router_source = self.all_functions
+        resolved = self._uri_router.resolve(str(uri))
+        if resolved is None:
+            # Resource的uri是AnyUrl规范化过的（比如file://a.txt会变成file://a.txt/），再用规范化的uri试一次
+            try:
+                normalized = str(AnyUrl(str(uri)))
+            except ValueError:
+                return None
+            resolved = self._uri_router.resolve(normalized) if normalized != str(uri) else None
+        if resolved is None:
+            return None
+        name, arguments = resolved
+        return self.all_functions[name], arguments
+
+    def _start_batch(
+        self,
+        calls: list[tuple[str, dict[str, Any] | None]],
+        max_concurrency: int,
+        max_concurrency_per_server: int,
+        timeout: float | None,
+        deadline: Deadline | None,
+        full: bool,
+    ) -> list[asyncio.Task]:
+        global_semaphore = asyncio.Semaphore(max_concurrency)
+        # 按server_name分组，每个Server一个信号量
+        server_semaphores: dict[str, asyncio.Semaphore] = {}
+
+        async def call(index: int, name: str, arguments: dict[str, Any] | None) -> MCPCallResult:
+            item = MCPCallResult(index=index, name=name, arguments=arguments)
+            try:
+                server_name = self.all_functions[name].server_name
+                server_semaphore = server_semaphores.setdefault(
+                    server_name, asyncio.Semaphore(max_concurrency_per_server)
+                )
+                async with server_semaphore, global_semaphore:
+                    item.result = await self.call_function(name, arguments, timeout=timeout, deadline=deadline, full=full)
+            except Exception as e:
+                item.error = e
+            return item
+
+        return [
+            asyncio.create_task(call(index, name, arguments))
+            for index, (name, arguments) in enumerate(calls)
+        ]
+
+    async def call_many(
+        self,
+        calls: list[tuple[str, dict[str, Any] | None]],
+        max_concurrency: int = 32,
+        max_concurrency_per_server: int = 8,
+        timeout: float | None = None,
+        deadline: Deadline | None = None,
+        full: bool = False,
+    ) -> list[MCPCallResult]:
+        """
+        批量并发调用，返回的结果和calls的顺序一致。单个调用失败不会影响其他调用，异常保存在结果的error中
+        :param calls: [(函数名, 参数), ...]
+        :param max_concurrency: 整个批次同时进行的调用数量上限
+        :param max_concurrency_per_server: 同一个Server同时进行的调用数量上限
+        :param timeout: 单个调用的超时时间，见call_function
+        :param deadline: 整个批次的截止时间，排队等待的时间也算在内
+        :param full: 结果是完整的MCPResult，见call_function
+        """
+        tasks = self._start_batch(calls, max_concurrency, max_concurrency_per_server, timeout, deadline, full)
+        try:
+            return await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def call_many_as_completed(
+        self,
+        calls: list[tuple[str, dict[str, Any] | None]],
+        max_concurrency: int = 32,
+        max_concurrency_per_server: int = 8,
+        timeout: float | None = None,
+        deadline: Deadline | None = None,
+        full: bool = False,
+    ) -> AsyncIterator[MCPCallResult]:
+        """
+        和call_many一样，但是哪个调用先完成就先返回哪个，可以通过结果的index对应到calls。
+        提前停止迭代时，还没完成的调用会被取消
+        """
+        tasks = self._start_batch(calls, max_concurrency, max_concurrency_per_server, timeout, deadline, full)
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
 
     async def aclose(self):
+        for task in self._background_tasks:
+            task.cancel()
+        await asyncio.gather(*self._background_tasks, return_exceptions=True)
         await self._exit_stack.aclose()
 
     async def __aenter__(self):
@@ -0,0 +1,286 @@
+# 链路追踪：Agent循环、大模型补全、MCP调用以及服务端的Tool放在同一条链路上。
+# 默认什么都不做；安装了OpenTelemetry时可以用OpenTelemetryTracer，离线测试可以用InMemoryTracer。
+# 链路上下文按W3C Trace Context格式（traceparent）放在MCP请求的_meta中传给服务端
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Iterator
+from mcp.server.fastmcp import FastMCP
+import inspect
+import json
+import os
+import time
+
+
+class _NoopSpan:
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """默认的Tracer，不记录任何东西"""
+    @contextmanager
+    def start_span(self, name: str, attributes: dict[str, Any] | None = None, parent: str | None = None) -> Iterator[Any]:
+        """
+        开始一个span，在with块中它就是当前的span，新的span默认以当前的span为父节点
+        :param parent: 父span的traceparent（比如从MCP请求的_meta中取出来的），None表示使用当前的span
+        """
+        yield _NOOP_SPAN
+
+    def inject(self, carrier: dict[str, str]):
+        """把当前span的traceparent写入carrier，没有当前span时什么都不写"""
+        pass
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, span_id: str, parent_id: str | None, attributes: dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_time = time.time()
+        self.end_time: float | None = None
+        # ok或者error，error时exception是异常的repr
+        self.status = "ok"
+        self.exception: str | None = None
+
+    def __repr__(self):
+        return f"Span({self.name!r}, span_id={self.span_id}, parent_id={self.parent_id})"
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    @property
+    def duration(self) -> float:
+        return (self.end_time or time.time()) - self.start_time
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+
+def parse_traceparent(traceparent: str) -> tuple[str, str] | None:
+    """traceparent -> (trace_id, 父span_id)，格式不对时返回None"""
+    parts = traceparent.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+class InMemoryTracer(Tracer):
+    """把结束的span保存在内存中，用于测试和离线分析"""
+    def __init__(self):
+        self.spans: list[Span] = []
+        self._current: ContextVar[Span | None] = ContextVar(f"current_span_{id(self)}", default=None)
+
+    @contextmanager
+    def start_span(self, name: str, attributes: dict[str, Any] | None = None, parent: str | None = None) -> Iterator[Span]:
+        remote = parse_traceparent(parent) if parent else None
+        if remote is not None:
+            trace_id, parent_id = remote
+        else:
+            current = self._current.get()
+            trace_id = current.trace_id if current else os.urandom(16).hex()
+            parent_id = current.span_id if current else None
+        span = Span(name, trace_id, os.urandom(8).hex(), parent_id, dict(attributes or {}))
+        token = self._current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.exception = repr(e)
+            raise
+        finally:
+            span.end_time = time.time()
+            self._current.reset(token)
+            self._finish(span)
+
+    def _finish(self, span: Span):
+        self.spans.append(span)
+
+    def inject(self, carrier: dict[str, str]):
+        current = self._current.get()
+        if current is not None:
+            carrier["traceparent"] = current.traceparent
+
+    def find(self, name: str) -> list[Span]:
+        return [span for span in self.spans if span.name == name]
+
+    def children(self, span: Span) -> list[Span]:
+        return [child for child in self.spans if child.parent_id == span.span_id]
+
+    def clear(self):
+        self.spans.clear()
+
+
+class JsonLinesTracer(InMemoryTracer):
+    """
+    除了保存在内存中，每个结束的span还以一行JSON追加到文件中。
+    用于离线检查另一个进程（比如stdio启动的MCP Server）中的span
+    """
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+
+    def _finish(self, span: Span):
+        super()._finish(span)
+        with open(self.path, mode='a', encoding='utf-8') as f:
+            f.write(json.dumps({
+                "name": span.name,
+                "trace_id": span.trace_id,
+                "span_id": span.span_id,
+                "parent_id": span.parent_id,
+                "attributes": span.attributes,
+                "status": span.status,
+                "start_time": span.start_time,
+                "end_time": span.end_time,
+            }, ensure_ascii=False, default=str) + "\n")
+
+
+def load_spans(path: str) -> list[Span]:
+    """读取JsonLinesTracer写入的span"""
+    spans = []
+    with open(path, mode='r', encoding='utf-8') as f:
+        for line in f:
+            data = json.loads(line)
+            span = Span(data["name"], data["trace_id"], data["span_id"], data["parent_id"], data["attributes"])
+            span.start_time, span.end_time, span.status = data["start_time"], data["end_time"], data["status"]
+            spans.append(span)
+    return spans
+
+
+class OpenTelemetryTracer(Tracer):
+    """使用OpenTelemetry的Tracer，span由OpenTelemetry SDK配置的exporter导出"""
+    def __init__(self, tracer=None):
+        """
+        :param tracer: opentelemetry.trace.Tracer，None表示使用全局的TracerProvider创建
+        """
+        try:
+            from opentelemetry import propagate, trace
+        except ImportError as e:
+            raise ImportError("OpenTelemetryTracer需要安装opentelemetry-api：pip install opentelemetry-api") from e
+        self._propagate = propagate
+        self._tracer = tracer or trace.get_tracer("mcp-application")
+
+    @contextmanager
+    def start_span(self, name: str, attributes: dict[str, Any] | None = None, parent: str | None = None) -> Iterator[Any]:
+        context = self._propagate.extract({"traceparent": parent}) if parent else None
+        with self._tracer.start_as_current_span(name, context=context, attributes=attributes) as span:
+            yield span
+
+    def inject(self, carrier: dict[str, str]):
+        self._propagate.inject(carrier)
+
+
+_tracer: Tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def set_tracer(tracer: Tracer | None):
+    """设置全局的Tracer，None表示恢复成不记录"""
+    global _tracer
+    _tracer = tracer if tracer is not None else Tracer()
+
+
+def _server_span(app: FastMCP, name: str, attributes: dict[str, Any]):
+    """服务端处理请求的span，父span是请求的_meta中客户端带过来的traceparent"""
+    meta = app.get_context().request_context.meta
+    parent = getattr(meta, "traceparent", None) if meta is not None else None
+    return get_tracer().start_span(name, attributes, parent=parent)
+
+
+class TracedFastMCP(FastMCP):
+    """
+    给Tool、Resource、Prompt加上span的FastMCP，用法和FastMCP一样。
+    客户端在请求的_meta中带了traceparent时，服务端的span会挂在客户端调用的span下面
+    """
+    async def call_tool(self, name: str, arguments: dict[str, Any]):
+        with _server_span(self, "FastMCP.call_tool", {"mcp.function.name": name}):
+            return await super().call_tool(name, arguments)
+
+    async def read_resource(self, uri):
+        with _server_span(self, "FastMCP.read_resource", {"mcp.resource.uri": str(uri)}):
+            return await super().read_resource(uri)
+
+    async def get_prompt(self, name: str, arguments: dict[str, Any] | None = None):
+        with _server_span(self, "FastMCP.get_prompt", {"mcp.function.name": name}):
+            return await super().get_prompt(name, arguments)
+
+
+def instrument_fastmcp(app: FastMCP) -> FastMCP:
+    """
+    给已经创建好的FastMCP应用加上和TracedFastMCP一样的span，用于没法改成TracedFastMCP的现有应用。
+    需要在app.run之前调用：
+        app = FastMCP("calculator")
+        ...
+        instrument_fastmcp(app)
+        app.run(transport="sse")
+    """
+    # FastMCP在__init__中就把自己的call_tool等方法注册给了底层的Server，没有公开的接口可以替换，
+    # 只能通过_mcp_server重新注册；新写的应用应该直接使用TracedFastMCP
+    server = getattr(app, "_mcp_server", None)
+    if server is None:
+        raise TypeError("当前版本的FastMCP没有_mcp_server，不能用instrument_fastmcp，请改用TracedFastMCP")
+
+    async def call_tool(name: str, arguments: dict[str, Any]):
+        with _server_span(app, "FastMCP.call_tool", {"mcp.function.name": name}):
+            return await app.call_tool(name, arguments)
+
+    async def read_resource(uri):
+        with _server_span(app, "FastMCP.read_resource", {"mcp.resource.uri": str(uri)}):
+            return await app.read_resource(uri)
+
+    async def get_prompt(name: str, arguments: dict[str, Any] | None = None):
+        with _server_span(app, "FastMCP.get_prompt", {"mcp.function.name": name}):
+            return await app.get_prompt(name, arguments)
+
+    server.call_tool(validate_input=False)(call_tool)
+    server.read_resource()(read_resource)
+    server.get_prompt()(get_prompt)
+    return app
+
+
+def trace_openai(client):
+    """
+    给OpenAI（或者AsyncOpenAI）客户端的chat.completions.create加上span，返回同一个客户端：
+        deepseek = trace_openai(OpenAI(api_key=..., base_url="https://api.deepseek.com"))
+    """
+    completions = client.chat.completions
+    create = completions.create
+
+    def attributes(kwargs: dict[str, Any]) -> dict[str, Any]:
+        return {
+            "llm.model": kwargs.get("model", ""),
+            "llm.messages": len(kwargs.get("messages") or ()),
+            "llm.tools": len(kwargs.get("tools") or ()),
+        }
+
+    def finish(span, response):
+        choices = getattr(response, "choices", None)
+        if choices:
+            span.set_attribute("llm.finish_reason", choices[0].finish_reason or "")
+
+    if inspect.iscoroutinefunction(inspect.unwrap(create)):
+        @wraps(create)
+        async def traced_create(*args, **kwargs):
+            with get_tracer().start_span("OpenAI.chat.completions.create", attributes(kwargs)) as span:
+                response = await create(*args, **kwargs)
+                finish(span, response)
+                return response
+    else:
+        @wraps(create)
+        def traced_create(*args, **kwargs):
+            with get_tracer().start_span("OpenAI.chat.completions.create", attributes(kwargs)) as span:
+                response = create(*args, **kwargs)
+                finish(span, response)
+                return response
+
+    completions.create = traced_create
+    return client
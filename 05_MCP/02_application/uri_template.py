@@ -0,0 +1,160 @@
+# Resource Template的uri模板（RFC 6570 level 1-2）：预先编译，用于格式化uri，以及把uri反向解析成模板和参数
+from typing import Any, Generic, Hashable, TypeVar
+from urllib.parse import quote, unquote
+import re
+
+_EXPRESSION = re.compile(r"{([^{}]*)}")
+_VARIABLE_NAME = re.compile(r"^[A-Za-z0-9_]([A-Za-z0-9_.]|%[0-9A-Fa-f]{2})*$")
+# 不需要编码的字符：simple（{var}）只保留unreserved，reserved（{+var}、{#var}）还保留reserved字符
+_UNRESERVED = "-._~"
+_RESERVED = ":/?#[]@!$&'()*+,;="
+
+
+class UriTemplateError(ValueError):
+    pass
+
+
+class UriTemplate:
+    """
+    编译好的uri模板，支持RFC 6570 level 1-2：{var}、{+var}、{#var}，每个表达式一个变量
+    """
+    def __init__(self, template: str):
+        self.template = template
+        # 模板的组成部分：字面量字符串，或者(操作符, 变量名)
+        self._parts: list[str | tuple[str, str]] = []
+        self.variables: list[str] = []
+        pattern = []
+        position = 0
+        for match in _EXPRESSION.finditer(template):
+            literal = template[position:match.start()]
+            if literal:
+                self._parts.append(literal)
+                pattern.append(re.escape(literal))
+            operator, name = self._parse_expression(match.group(1))
+            if name in self.variables:
+                raise UriTemplateError(f"uri模板{template}中的变量{name}重复了")
+            self._parts.append((operator, name))
+            self.variables.append(name)
+            group = f"(?P<_{len(self.variables) - 1}>"
+            if operator == "":
+                # 简单展开的值中，/ ? #一定是被编码过的
+                pattern.append(group + "[^/?#]*)")
+            elif operator == "+":
+                pattern.append(group + ".*?)")
+            else:
+                pattern.append("#" + group + ".*?)")
+            position = match.end()
+        rest = template[position:]
+        if "{" in rest or "}" in rest:
+            raise UriTemplateError(f"uri模板{template}中的括号不匹配")
+        if rest:
+            self._parts.append(rest)
+            pattern.append(re.escape(rest))
+        self._regex = re.compile("".join(pattern))
+        # 第一个变量之前的字面量，反向解析时用来快速定位模板
+        first = self._parts[0] if self._parts else ""
+        self.prefix = first if isinstance(first, str) else ""
+
+    def _parse_expression(self, expression: str) -> tuple[str, str]:
+        operator = ""
+        if expression[:1] in ("+", "#"):
+            operator, expression = expression[0], expression[1:]
+        elif expression[:1] in (".", "/", ";", "?", "&", "=", ",", "!", "@", "|"):
+            raise UriTemplateError(f"uri模板{self.template}中的操作符{expression[0]}不支持，只支持RFC 6570 level 1-2")
+        if not _VARIABLE_NAME.match(expression):
+            raise UriTemplateError(f"uri模板{self.template}中的表达式{{{expression}}}不支持，只支持RFC 6570 level 1-2")
+        return operator, expression
+
+    def __repr__(self):
+        return f"UriTemplate({self.template!r})"
+
+    def check_arguments(self, arguments: dict[str, Any]):
+        """参数名必须和模板中的变量完全一致，否则抛出UriTemplateError"""
+        missing = [name for name in self.variables if name not in arguments]
+        extra = [name for name in arguments if name not in self.variables]
+        if missing or extra:
+            message = f"uri模板{self.template}的参数不正确"
+            if missing:
+                message += f"，缺少参数：{', '.join(missing)}"
+            if extra:
+                message += f"，多余的参数：{', '.join(extra)}"
+            raise UriTemplateError(message)
+
+    def expand(self, arguments: dict[str, Any] | None = None) -> str:
+        """把参数格式化到模板中，参数值会按RFC 6570进行百分号编码"""
+        arguments = arguments or {}
+        self.check_arguments(arguments)
+        result = []
+        for part in self._parts:
+            if isinstance(part, str):
+                result.append(part)
+                continue
+            operator, name = part
+            value = str(arguments[name])
+            if operator == "":
+                result.append(quote(value, safe=_UNRESERVED))
+            else:
+                # reserved展开时，已经编码过的%XX保持原样
+                encoded = quote(value, safe=_UNRESERVED + _RESERVED + "%")
+                encoded = re.sub(r"%(?![0-9A-Fa-f]{2})", "%25", encoded)
+                result.append(encoded if operator == "+" else "#" + encoded)
+        return "".join(result)
+
+    def match(self, uri: str) -> dict[str, str] | None:
+        """expand的反向操作：uri符合模板时返回参数，否则返回None"""
+        match = self._regex.fullmatch(uri)
+        if match is None:
+            return None
+        return {name: unquote(match.group(f"_{i}")) for i, name in enumerate(self.variables)}
+
+
+K = TypeVar("K", bound=Hashable)
+
+
+class UriTemplateRouter(Generic[K]):
+    """
+    uri -> (模板的key, 参数)的反向路由。
+    模板按第一个变量之前的字面量前缀分桶，解析时只需要查看和uri前缀相同的桶，
+    不需要逐个尝试所有模板
+    """
+    def __init__(self):
+        # 前缀 -> [(key, 模板), ...]
+        self._buckets: dict[str, list[tuple[K, UriTemplate]]] = {}
+        # 所有出现过的前缀长度，从长到短，前缀越长越具体
+        self._prefix_lengths: list[int] = []
+        self._keys: dict[K, UriTemplate] = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key: K, template: UriTemplate | str):
+        if not isinstance(template, UriTemplate):
+            template = UriTemplate(template)
+        self.remove(key)
+        self._keys[key] = template
+        self._buckets.setdefault(template.prefix, []).append((key, template))
+        if len(template.prefix) not in self._prefix_lengths:
+            self._prefix_lengths.append(len(template.prefix))
+            self._prefix_lengths.sort(reverse=True)
+
+    def remove(self, key: K):
+        template = self._keys.pop(key, None)
+        if template is None:
+            return
+        bucket = self._buckets[template.prefix]
+        bucket[:] = [(k, t) for k, t in bucket if k != key]
+        if not bucket:
+            del self._buckets[template.prefix]
+            if not any(len(prefix) == len(template.prefix) for prefix in self._buckets):
+                self._prefix_lengths.remove(len(template.prefix))
+
+    def resolve(self, uri: str) -> tuple[K, dict[str, str]] | None:
+        """找到匹配uri的模板，返回(模板的key, 参数)，没有匹配的模板时返回None"""
+        for length in self._prefix_lengths:
+            if length > len(uri):
+                continue
+            for key, template in self._buckets.get(uri[:length], ()):
+                arguments = template.match(uri)
+                if arguments is not None:
+                    return key, arguments
+        return None